@@ -1,5 +1,6 @@
 from flask import Flask, request, url_for
 from app.extensions import db, migrate
+from app.page_cache import page_cache
 from app.routes import bp
 from werkzeug.routing import BuildError
 
@@ -29,6 +30,7 @@ def create_app():
     
     db.init_app(app)
     migrate.init_app(app, db)
+    page_cache.init_app(app)
     
     app.register_blueprint(bp)    
     
@@ -12,6 +12,21 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # signs the keyset pagination cursors, see app/keyset.py; the same in every worker
+    SECRET_KEY = os.getenv("SECRET_KEY")
+
+    # rendered page cache, see app/page_cache.py
+    PAGE_CACHE = os.getenv("PAGE_CACHE", "memory")  # "memory", "redis" or "off"
+    PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "256"))
+    PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", str(6 * 3600)))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # static snapshot written after each pipeline run, see app/services/export_static.py
+    STATIC_EXPORT_DIR = os.getenv("STATIC_EXPORT_DIR")  # unset: no export
+    STATIC_EXPORT_PAGES = int(os.getenv("STATIC_EXPORT_PAGES", "1"))  # pages per view and sort
+    STATIC_EXPORT_WORKERS = int(os.getenv("STATIC_EXPORT_WORKERS", "4"))
+    STATIC_EXPORT_BASE_URL = os.getenv("STATIC_EXPORT_BASE_URL")  # public site URL for canonical links, required with STATIC_EXPORT_DIR
+
 
     
 
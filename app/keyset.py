@@ -0,0 +1,283 @@
+# KEYSET (SEEK) PAGINATION FOR THE LIST VIEWS
+# A page is "the next per_page rows after this row" in the sort order, so every
+# page is one index range read instead of an OFFSET that walks all rows before it.
+#
+# The cursor in the URL is opaque: the sort key values of the first/last row on
+# the page, the page number and a hash of the sort, signed with SECRET_KEY so
+# the values that go into the query can't be forged. Without SECRET_KEY there
+# are no cursors: the links fall back to ?page= (OFFSET) and a warning is
+# logged once. The last sort key must be unique (the id) so the order is total. Nullable keys
+# sort NULLS LAST in both directions; keys the query's filters keep NOT NULL
+# (not_null) use the default order instead, so one index serves both directions.
+#
+# Totals are counted once per data_version and kept in memory, so crawling
+# page after page costs one indexed LIMIT query per page.
+
+import hashlib
+import logging
+import math
+from decimal import Decimal
+
+from flask import current_app
+from itsdangerous import BadData, URLSafeSerializer
+from sqlalchemy import and_, false, or_, tuple_
+
+from app.extensions import db
+from app.page_cache import LRUPageStore, data_version
+
+# counted totals, per data_version
+count_store = LRUPageStore(maxsize=1024)
+
+
+class KeysetPagination:
+    """The attributes render_pagination needs, like Flask-SQLAlchemy's Pagination."""
+
+    cursor_pages = True
+
+    def __init__(self, items, page, per_page, total, has_prev, has_next, next_cursor, prev_cursor):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.has_prev = has_prev
+        self.has_next = has_next
+        # None without SECRET_KEY, the links then use ?page=
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor  # also None on page 2: the link goes to the plain first page
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+
+# --------------------------
+# Cursors
+# --------------------------
+
+def sort_signature(keys):
+    """Short hash of the sort keys, so a cursor is ignored once the sort changes."""
+    raw = "|".join(f"{expr}:{'desc' if descending else 'asc'}" for expr, descending in keys)
+    return hashlib.sha1(raw.encode()).hexdigest()[:8]
+
+
+def _encode_value(value):
+    if isinstance(value, Decimal):
+        return {"d": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return Decimal(value["d"])
+    return value
+
+
+_warned_no_key = False
+
+
+def cursor_serializer():
+    """The cursor signer, or None (warned about once) if SECRET_KEY is not set."""
+    global _warned_no_key
+
+    secret_key = current_app.config.get("SECRET_KEY")
+    if not secret_key:
+        if not _warned_no_key:
+            _warned_no_key = True
+            logging.warning("SECRET_KEY is not set; pagination falls back to ?page= links instead of cursors.")
+        return None
+    return URLSafeSerializer(secret_key, salt="keyset-cursor")
+
+
+def encode_cursor(signature, page, backwards, values):
+    """The signed cursor, or None without SECRET_KEY."""
+    serializer = cursor_serializer()
+    if serializer is None:
+        return None
+
+    return serializer.dumps({
+        "s": signature,
+        "p": page,
+        "b": backwards,
+        "k": [_encode_value(value) for value in values],
+    })
+
+
+def decode_cursor(cursor, signature, key_count):
+    """
+    (page, backwards, values), or None if the cursor is not signed by us,
+    malformed or for another sort.
+    """
+    if not cursor:
+        return None
+
+    serializer = cursor_serializer()
+    if serializer is None:
+        return None
+
+    try:
+        state = serializer.loads(cursor)
+        page = int(state["p"])
+        backwards = bool(state["b"])
+        values = [_decode_value(value) for value in state["k"]]
+    except (BadData, ValueError, TypeError, KeyError, AttributeError, ArithmeticError):
+        return None
+
+    if state.get("s") != signature or len(values) != key_count or page < 1:
+        return None
+
+    return page, backwards, values
+
+
+# --------------------------
+# Query building
+# --------------------------
+
+def _is_nullable(expr, not_null=()):
+    if any(expr is known for known in not_null):
+        return False
+    column = getattr(expr, "expression", expr)
+    return getattr(column, "nullable", True)
+
+
+def seek_condition(keys, values, backwards=False):
+    """
+    Rows after (or before) the row with the given key values, in the order
+    of keys, a list of (expression, descending, nullable).
+    """
+    exprs = [expr for expr, _, _ in keys]
+    directions = {descending for _, descending, _ in keys}
+
+    # one direction and no NULL in the cursor: a row comparison, which an
+    # index on the key columns can serve as a range
+    if len(directions) == 1 and all(value is not None for value in values):
+        descending = directions.pop()
+        row, cursor = tuple_(*exprs), tuple_(*values)
+        ahead = row < cursor if descending != backwards else row > cursor
+
+        if backwards:
+            return ahead
+
+        # NULLs sort last, and a row comparison that reaches one is NULL
+        clauses = [ahead]
+        for i, (expr, _, nullable) in enumerate(keys):
+            if nullable:
+                clauses.append(and_(*[e == v for e, v in zip(exprs[:i], values[:i])], expr.is_(None)))
+        return or_(*clauses)
+
+    # general case: the first key that differs decides
+    clauses = []
+    equal = []
+
+    for (expr, descending, _), value in zip(keys, values):
+        if value is None:
+            step = expr.isnot(None) if backwards else None
+        elif backwards:
+            step = expr > value if descending else expr < value
+        else:
+            step = or_(expr < value if descending else expr > value, expr.is_(None))
+
+        if step is not None:
+            clauses.append(and_(*equal, step))
+        equal.append(expr.is_(None) if value is None else expr == value)
+
+    return or_(*clauses) if clauses else false()
+
+
+def order_clauses(keys, backwards=False):
+    clauses = []
+    for expr, descending, nullable in keys:
+        if not nullable:
+            clauses.append(expr.desc() if descending != backwards else expr.asc())
+        elif descending != backwards:
+            clauses.append(expr.desc().nullsfirst() if backwards else expr.desc().nullslast())
+        else:
+            clauses.append(expr.asc().nullsfirst() if backwards else expr.asc().nullslast())
+    return clauses
+
+
+def cached_count(query):
+    """COUNT(*) of query, counted once per data_version."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    raw = str(compiled) + repr(sorted(compiled.params.items()))
+    key = hashlib.sha1(raw.encode()).hexdigest()
+
+    version = data_version()
+    total = count_store.get(version, key)
+    if total is None:
+        total = query.order_by(None).count()
+        count_store.set(version, key, total)
+    return total
+
+
+def keyset_paginate(query, keys, cursor=None, page=1, per_page=50, total=None, not_null=()):
+    """
+    One page of query ordered by keys, a list of (expression, descending)
+    whose last expression is unique. Without a cursor, page > 1 falls back to
+    OFFSET, so old ?page= links keep working; the links on the page are cursors.
+    not_null lists key expressions the query's filters keep NOT NULL.
+    total is counted (and cached) if not given.
+    """
+    signature = sort_signature(keys)
+    state = decode_cursor(cursor, signature, len(keys))
+    keys = [(expr, descending, _is_nullable(expr, not_null)) for expr, descending in keys]
+
+    # rows are (entity, keys...) for entity queries, (columns..., keys...) otherwise
+    descriptions = query.column_descriptions
+    entity_query = len(descriptions) == 1 and isinstance(descriptions[0]["expr"], type)
+
+    if total is None:
+        total = cached_count(query)
+
+    backwards = False
+    page = max(page, 1)
+    paged = query.order_by(None).add_columns(*[expr.label(f"_key{i}") for i, (expr, _, _) in enumerate(keys)])
+
+    if state:
+        page, backwards, values = state
+        paged = paged.filter(seek_condition(keys, values, backwards))
+
+    paged = paged.order_by(*order_clauses(keys, backwards))
+    if not state and page > 1:
+        paged = paged.offset((page - 1) * per_page)
+
+    rows = paged.limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+        has_prev = more
+        has_next = True
+        if not more:
+            page = 1  # reached the start, whatever the cursor said
+    else:
+        has_prev = page > 1
+        has_next = more
+
+    def key_values(row):
+        return list(row[len(row) - len(keys):])
+
+    has_next = has_next and bool(rows)
+
+    next_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(signature, page + 1, False, key_values(rows[-1]))
+
+    prev_cursor = None
+    if has_prev and rows and page > 2:
+        prev_cursor = encode_cursor(signature, page - 1, True, key_values(rows[0]))
+
+    items = [row[0] for row in rows] if entity_query else rows
+
+    return KeysetPagination(items, page, per_page, total, has_prev, has_next, next_cursor, prev_cursor)
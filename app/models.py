@@ -1,6 +1,7 @@
 from app.extensions import db
 from datetime import datetime, timezone
-from sqlalchemy.sql import func
+from sqlalchemy import Boolean, DateTime, Integer, Numeric, String
+from sqlalchemy.sql import column, func, table
 
 # --------------------------
 # Canonical ThinkPad models
@@ -41,6 +42,13 @@ class Model(db.Model):
     listing = db.relationship("Listing", back_populates="model", uselist=False)
     stats = db.relationship("ModelPriceStats", back_populates="model", uselist=False, cascade="all, delete-orphan", single_parent=True)
 
+    __table_args__ = (
+        # model pages, thinkpad_models and price drops go from canonical model to listing
+        db.Index("idx_models_canon_listing", "canon_model_id", "listing_id"),
+        # sort by model name
+        db.Index("idx_models_lower_name", db.text("lower(name)"), "listing_id"),
+    )
+
 
 # --------------------------
 # Listings
@@ -64,13 +72,18 @@ class Listing(db.Model):
     first_seen = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     last_seen = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     miss_count = db.Column(db.Integer, nullable=False, default=0)
-    ended_at = db.Column(db.DateTime, nullable=True)
+    ended_at = db.Column(db.DateTime, nullable=True, index=True)
     last_updated = db.Column(
         db.DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
 
+    # Title parsing bookkeeping (see title_parse.process_title)
+    title_hash = db.Column(db.String(32))  # md5 of the title that was parsed
+    parse_version = db.Column(db.Integer, index=True)  # PARSE_VERSION used
+    parsed_at = db.Column(db.DateTime(timezone=True), index=True)
+
     # Link to parsed model
     model = db.relationship(
         "Model",
@@ -86,6 +99,20 @@ class Listing(db.Model):
 
     __table_args__ = (
         db.Index("idx_listings_marketplace_status_price", "marketplace", "status", "price"),
+        # list pages only show ACTIVE listings, sorted by price with id as the keyset tiebreak
+        db.Index(
+            "idx_listings_active_market_price",
+            "marketplace",
+            "price",
+            "id",
+            postgresql_where=db.text("status = 'ACTIVE'"),
+        ),
+        # only holds listings that are unparsed or whose title changed since parsing
+        db.Index(
+            "idx_listings_needs_parse",
+            "id",
+            postgresql_where=db.text("parse_version IS NULL OR title_hash IS DISTINCT FROM md5(COALESCE(title, ''))"),
+        ),
     )
 
     @property
@@ -121,33 +148,109 @@ class Specs(db.Model):
 
     __table_args__ = (
         db.Index("idx_specs_search", "cpu", "ram", "storage"),
+        # sort by lower(cpu)
+        db.Index("idx_specs_lower_cpu", db.text("lower(cpu)"), "listing_id"),
     )
 
 # --------------------------
 # Price History
 # --------------------------
 class PriceHistory(db.Model):
+    """
+    Append-only, range partitioned by month on recorded_at
+    (partitions are created by services.price_history.ensure_price_history_partitions).
+    """
     __tablename__ = "price_history"
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     listing_id = db.Column(db.Integer, db.ForeignKey("listings.id", ondelete="CASCADE"))
     price = db.Column(db.Numeric(10, 2))
     currency = db.Column(db.String(10), nullable=False)
-    recorded_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    recorded_at = db.Column(db.DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.now())
 
     listing = db.relationship("Listing", back_populates="price_history")
 
+    __table_args__ = (
+        db.Index("idx_price_history_listing_recorded", "listing_id", recorded_at.desc()),
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
+    )
+
+
+class PriceHistoryDaily(db.Model):
+    """
+    price_history downsampled to one row per listing and day,
+    for months past the raw retention window.
+    """
+    __tablename__ = "price_history_daily"
+
+    listing_id = db.Column(db.Integer, db.ForeignKey("listings.id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    currency = db.Column(db.String(10), nullable=False)
+    min_price = db.Column(db.Numeric(10, 2))
+    max_price = db.Column(db.Numeric(10, 2))
+    last_price = db.Column(db.Numeric(10, 2))
+    last_recorded_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+
+
+class ListingPriceChange(db.Model):
+    """
+    Latest price_history change per listing, kept by insert_price_history.
+    new_price is the last recorded price, old_price the one recorded before it.
+    status follows the listing's (update_listing_lifecycle), so the drop
+    indexes only hold ACTIVE listings.
+    """
+    __tablename__ = "listing_price_changes"
+
+    listing_id = db.Column(db.Integer, db.ForeignKey("listings.id", ondelete="CASCADE"), primary_key=True)
+    marketplace = db.Column(db.String)
+    currency = db.Column(db.String(10), nullable=False)
+    new_price = db.Column(db.Numeric(10, 2))
+    old_price = db.Column(db.Numeric(10, 2))
+    drop_amount = db.Column(db.Numeric(10, 2))  # old_price - new_price
+    discount_percent = db.Column(db.Numeric(8, 2))  # drop_amount / old_price * 100
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    status = db.Column(db.String, nullable=False, server_default="ACTIVE")
+
+    # one index per price-drops sort key, drops of ACTIVE listings only, ending in the keyset tiebreak keys
+    __table_args__ = (
+        db.Index("idx_price_changes_drop_discount", "marketplace", "discount_percent", "drop_amount", "listing_id", postgresql_where=db.text("status = 'ACTIVE' AND new_price < old_price")),
+        db.Index("idx_price_changes_drop_old", "marketplace", "old_price", "drop_amount", "listing_id", postgresql_where=db.text("status = 'ACTIVE' AND new_price < old_price")),
+        db.Index("idx_price_changes_drop_new", "marketplace", "new_price", "drop_amount", "listing_id", postgresql_where=db.text("status = 'ACTIVE' AND new_price < old_price")),
+    )
+
 
 # --------------------------
 # Temp tables (for API fetch)
 # --------------------------
+class FetchBatch(db.Model):
+    """
+    One load of the staging tables. A fetch worker opens a batch, loads its
+    rows under the batch id and closes it; the pipeline then processes that
+    batch only. status: LOADING -> LOADED -> PROCESSED (see services.batches).
+    """
+    __tablename__ = "fetch_batches"
+
+    id = db.Column(db.Integer, primary_key=True)
+    marketplaces = db.Column(db.ARRAY(db.String), nullable=False)  # marketplaces the scrape covered, misses only count there
+    status = db.Column(db.String(20), nullable=False, default="LOADING")
+    item_count = db.Column(db.Integer)
+    started_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now())
+    loaded_at = db.Column(db.DateTime(timezone=True))
+    processed_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.Index("idx_fetch_batches_status", "status", "started_at"),
+    )
+
+
+# staging rows are rebuilt from the API every run, so they skip the WAL
 class TempSummaries(db.Model):
     __tablename__ = "temp_summaries"
 
-    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey("fetch_batches.id", ondelete="CASCADE"), primary_key=True)
+    ebay_item_id = db.Column(db.String, primary_key=True)
     category_id = db.Column(db.String(20))
-
-    ebay_item_id = db.Column(db.String, unique=True, nullable=False)
     title = db.Column(db.Text)
     price = db.Column(db.Numeric(10, 2))
     currency = db.Column(db.String(10), nullable=False)
@@ -163,12 +266,14 @@ class TempSummaries(db.Model):
     sold_at = db.Column(db.DateTime(timezone=True), nullable=True)
     last_updated = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
 
 class TempDetails(db.Model):
     __tablename__ = "temp_details"
 
-    id = db.Column(db.Integer, primary_key=True)
-    ebay_item_id = db.Column(db.Text, unique=True, nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey("fetch_batches.id", ondelete="CASCADE"), primary_key=True)
+    ebay_item_id = db.Column(db.Text, primary_key=True)
     cpu = db.Column(db.Text)
     cpu_freq = db.Column(db.Text)
     ram = db.Column(db.Text)
@@ -184,6 +289,8 @@ class TempDetails(db.Model):
     seller_feedback_score = db.Column(db.Integer)
     seller_feedback_percent = db.Column(db.Numeric(5, 2))
 
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
 
 # --------------------------
 # Price Stats
@@ -198,6 +305,7 @@ class ModelPriceStats(db.Model):
     min_price = db.Column(db.Numeric(10, 2))
     max_price = db.Column(db.Numeric(10, 2))
     listing_count = db.Column(db.Integer)
+    price_sum = db.Column(db.Numeric(14, 2))  # running sum, avg_price = price_sum / listing_count
     updated_at = db.Column(db.DateTime(timezone=True))
 
     model = db.relationship("Model", back_populates="stats")
@@ -207,6 +315,63 @@ class ModelPriceStats(db.Model):
     )
 
 
+class PriceStatsEntry(db.Model):
+    """
+    The price each ACTIVE listing currently contributes to model_price_stats.
+    Lets update_model_price_stats apply per-batch deltas instead of re-aggregating.
+    """
+    __tablename__ = "price_stats_entries"
+
+    listing_id = db.Column(db.Integer, db.ForeignKey("listings.id", ondelete="CASCADE"), primary_key=True)
+    model_id = db.Column(db.Integer, nullable=False)
+    canon_model_id = db.Column(db.Integer)
+    marketplace = db.Column(db.String)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+
+    __table_args__ = (
+        db.Index("idx_price_stats_entries_key", "model_id", "marketplace", "price"),
+        db.Index("idx_price_stats_entries_canon", "canon_model_id", "marketplace", "price"),
+    )
+
+
+class CanonicalPriceStats(db.Model):
+    """
+    Price stats of ACTIVE listings per canonical model and marketplace.
+    Refreshed by the pipeline for the keys a batch touched (see pipeline.refresh_canonical_price_stats).
+    """
+    __tablename__ = "canonical_price_stats"
+
+    canon_model_id = db.Column(db.Integer, db.ForeignKey("model_list.id", ondelete="CASCADE"), primary_key=True)
+    marketplace = db.Column(db.String, primary_key=True)
+    listing_count = db.Column(db.Integer, nullable=False)
+    min_price = db.Column(db.Numeric(10, 2))
+    avg_price = db.Column(db.Numeric(10, 2))
+    max_price = db.Column(db.Numeric(10, 2))
+    median_price = db.Column(db.Numeric(10, 2))
+    newest_listing = db.Column(db.DateTime(timezone=True))  # latest first_seen
+    last_seen = db.Column(db.DateTime(timezone=True))  # latest last_seen
+    cheapest_item = db.Column(db.String)  # ebay_item_id of the cheapest listing
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+    canon_model = db.relationship("ThinkPadModel")
+
+    __table_args__ = (
+        db.Index("idx_canonical_price_stats_market", "marketplace", "min_price"),
+    )
+
+
+class DataVersion(db.Model):
+    """
+    Single row (id = 1) counting data loads. Bumped whenever new data is
+    committed (see pipeline.bump_data_version); part of every page cache key.
+    """
+    __tablename__ = "data_version"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+
 class Marketplace(db.Model):
     __tablename__ = "marketplaces"
 
@@ -235,3 +400,23 @@ class Storage(db.Model):
     size = db.Column(db.String(20), unique=True, nullable=False)
 
 
+
+
+# --------------------------
+# Materialized views
+# Created and changed in migrations, not part of db.metadata,
+# so create_all / autogenerate leave them alone.
+# --------------------------
+DealsRollup = table(
+    "deals_rollup",
+    column("canon_model_id", Integer),
+    column("marketplace", String),
+    column("model_name", String),
+    column("slug", String),
+    column("cheapest_price", Numeric(10, 2)),
+    column("cheapest_item", String),
+    column("listing_count", Integer),
+    column("newest_listing", DateTime(timezone=True)),
+    column("is_best_deal", Boolean),
+    column("has_price_drop", Boolean),
+)
@@ -0,0 +1,177 @@
+# RENDERED PAGE CACHE FOR THE PUBLIC LISTING PAGES
+# Pages only change when new data is loaded, so a rendered page is kept until
+# data_version moves on (run_pipeline bumps it once the new data is visible).
+#
+# PAGE_CACHE = "memory" (default, per process LRU), "redis" (shared between
+# workers) or "off".
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from sqlalchemy import text
+
+from app.extensions import db
+
+
+class LRUPageStore:
+    """In-process LRU of rendered pages, dropped whenever the data version changes."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._pages = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._pages.clear()
+                self._version = version
+                return None
+            if version < self._version:
+                return None  # request started before the last bump
+
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def set(self, version, key, page):
+        with self._lock:
+            if version != self._version:
+                return
+
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+
+
+class RedisPageStore:
+    """
+    Pages in Redis, shared by every worker. The version is part of the key,
+    so pages of older versions are never read again and expire after ttl.
+    """
+
+    def __init__(self, url, ttl=6 * 3600, prefix="page"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, version, key):
+        return f"{self.prefix}:{version}:{key}"
+
+    def get(self, version, key):
+        raw = self.client.get(self._key(version, key))
+        if raw is None:
+            return None
+
+        head, body = raw.split(b"\n", 1)
+        status, mimetype = head.decode().split(" ", 1)
+        return int(status), mimetype, body
+
+    def set(self, version, key, page):
+        status, mimetype, body = page
+        raw = f"{status} {mimetype}\n".encode() + body
+        self.client.set(self._key(version, key), raw, ex=self.ttl)
+
+
+class PageCache:
+    def __init__(self):
+        self.store = None
+
+    def init_app(self, app):
+        backend = app.config.get("PAGE_CACHE", "memory")
+
+        if backend == "redis":
+            self.store = RedisPageStore(app.config["REDIS_URL"], ttl=app.config.get("PAGE_CACHE_TTL", 6 * 3600))
+        elif backend == "memory":
+            self.store = LRUPageStore(maxsize=app.config.get("PAGE_CACHE_SIZE", 256))
+        else:
+            self.store = None
+
+        app.extensions["page_cache"] = self
+
+
+page_cache = PageCache()
+
+# WSGI environ key of requests that render around the cache (the static export);
+# HTTP headers end up as HTTP_*, so clients can't set it
+SKIP_PAGE_CACHE = "page_cache.skip"
+
+
+def _read_data_version():
+    row = db.session.execute(text(r"""
+        SELECT version, updated_at FROM data_version WHERE id = 1;
+    """)).first()
+    g.data_version = row.version if row else 0
+    g.data_updated_at = row.updated_at if row else None
+
+
+def data_version():
+    """Current data_version, read once per request."""
+    if "data_version" not in g:
+        _read_data_version()
+    return g.data_version
+
+
+def data_updated_at():
+    """
+    When data_version last moved on, read with it. Cached pages use this
+    instead of the clock, which would otherwise freeze at render time.
+    """
+    if "data_version" not in g:
+        _read_data_version()
+    return g.data_updated_at
+
+
+def page_key():
+    """
+    Endpoint, scheme, host, path and the query args sorted by name, hashed.
+    Scheme and host are in there because layout.html renders an absolute
+    canonical link.
+    """
+    args = sorted(request.args.items(multi=True))
+    raw = "|".join([
+        request.endpoint or "",
+        request.scheme,
+        request.host.lower(),
+        request.path,
+        "&".join(f"{name}={value}" for name, value in args),
+    ])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def cached_page(view):
+    """
+    Serve a view from the page cache. Only 200 responses are stored; the
+    headers set after the view (e.g. the country cookie) still run on hits.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        store = page_cache.store
+        if store is None or request.environ.get(SKIP_PAGE_CACHE):
+            return view(*args, **kwargs)
+
+        version = data_version()
+        key = page_key()
+
+        page = store.get(version, key)
+        if page is not None:
+            status, mimetype, body = page
+            response = current_app.response_class(body, status=status, mimetype=mimetype)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough:
+            store.set(version, key, (response.status_code, response.mimetype, response.get_data()))
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    return wrapper
@@ -1,9 +1,10 @@
-from flask import abort
+from flask import abort, request
     
-from app.models import Listing, Model, Specs, ThinkPadModel
+from app.models import Listing, Model, Specs, ThinkPadModel, CanonicalPriceStats
 from app import db
-from sqlalchemy.orm import joinedload
-from sqlalchemy import func
+from app.keyset import keyset_paginate
+from sqlalchemy.orm import contains_eager
+from sqlalchemy import and_, func, true, tuple_
 
 SPEC_FILTERS = {
     "model": func.lower(Model.name),
@@ -68,31 +69,34 @@ def active_listings_query_for_model(model_id, marketplaces):
         Listing.query
         .join(Model, Model.listing_id == Listing.id)
         .join(Specs, Specs.listing_id == Listing.id)
-        .options(joinedload(Listing.model), joinedload(Listing.specs))
+        .options(contains_eager(Listing.model), contains_eager(Listing.specs))
         .filter(
             Model.canon_model_id == model_id,
             Listing.status == "ACTIVE",
             Listing.marketplace.in_(marketplaces),
+            Listing.price.isnot(None),
         )
     )
 
 def canonical_model_stats(model_id, marketplaces):
     """
-    Returns one row of aggregate stats for a canonical model.
-    Assumes one Model per Listing (1:1 relationship).
+    Returns one row of aggregate stats for a canonical model,
+    read from canonical_price_stats (one row per marketplace).
     """
     return (
         db.session.query(
-            func.min(Listing.price).label("lowest_price"),
-            func.avg(Listing.price).label("avg_price"),
-            func.max(Listing.price).label("highest_price"),
-            func.count(Listing.id).label("listing_count"),
+            func.min(CanonicalPriceStats.min_price).label("lowest_price"),
+            (
+                func.sum(CanonicalPriceStats.avg_price * CanonicalPriceStats.listing_count)
+                / func.nullif(func.sum(CanonicalPriceStats.listing_count), 0)
+            ).label("avg_price"),
+            func.max(CanonicalPriceStats.max_price).label("highest_price"),
+            func.max(CanonicalPriceStats.median_price).label("median_price"),  # exact for a single marketplace
+            func.coalesce(func.sum(CanonicalPriceStats.listing_count), 0).label("listing_count"),
         )
-        .join(Model, Model.listing_id == Listing.id)
         .filter(
-            Model.canon_model_id == model_id,
-            Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
+            CanonicalPriceStats.canon_model_id == model_id,
+            CanonicalPriceStats.marketplace.in_(marketplaces),
         )
         .first()
     )
@@ -102,10 +106,119 @@ def base_listing_query(marketplaces):
         Listing.query
         .join(Listing.model)
         .outerjoin(Listing.specs)
-        .options(joinedload(Listing.model), joinedload(Listing.specs))
+        .options(contains_eager(Listing.model), contains_eager(Listing.specs))
         .filter(
             Model.canon_model_id.isnot(None),
             Listing.status == "ACTIVE",
             Listing.marketplace.in_(marketplaces),
+            Listing.price.isnot(None),
         )
-    )
\ No newline at end of file
+    )
+
+
+def paginate_by_keys(query, keys, per_page=50, total=None, not_null=()):
+    """
+    keyset_paginate with the cursor (or legacy page number) from the query args.
+    keys: [(expression, descending), ...], the last one unique.
+    """
+    return keyset_paginate(
+        query,
+        keys,
+        cursor=request.args.get("cursor"),
+        page=request.args.get("page", 1, type=int),
+        per_page=per_page,
+        total=total,
+        not_null=not_null,
+    )
+
+
+def listing_sort_keys(order_col, descending):
+    """order_col, then price and id in the same direction, as keyset sort keys."""
+    keys = [(order_col, descending)]
+    if order_col is not Listing.price:
+        keys.append((Listing.price, descending))
+    keys.append((Listing.id, descending))
+    return keys
+
+
+def selected_spec_filters(args):
+    """{facet name: value} of the SPEC_FILTERS set in the query args, ram/storage as floats."""
+    selected = {}
+
+    for name in SPEC_FILTERS:
+        value = args.get(name)
+        if value in (None, ""):
+            continue
+
+        # Convert numeric fields to float
+        if name in ["ram", "storage"]:
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+
+        selected[name] = value
+
+    return selected
+
+
+def spec_facets(marketplaces, selected):
+    """
+    Values and counts of every SPEC_FILTERS facet in one GROUPING SETS query.
+
+    Each facet is counted under all selected filters except its own, so a
+    dropdown still lists the alternatives to its current value. The empty
+    grouping set gives the number of listings matching every filter.
+    Returns ({facet name: [(value, count), ...]}, total).
+    """
+    names = list(SPEC_FILTERS)
+    conditions = {name: SPEC_FILTERS[name] == value for name, value in selected.items()}
+
+    def matching(skip=None):
+        conds = [cond for name, cond in conditions.items() if name != skip]
+        return and_(*conds) if conds else true()
+
+    rows = (
+        db.session.query(
+            func.grouping(*SPEC_FILTERS.values()).label("grouping"),
+            *[column.label(name) for name, column in SPEC_FILTERS.items()],
+            *[func.count().filter(matching(name)).label(f"{name}_count") for name in names],
+            func.count().filter(matching()).label("total"),
+        )
+        .select_from(Listing)
+        .join(Model, Model.listing_id == Listing.id)
+        .outerjoin(Specs, Specs.listing_id == Listing.id)
+        .filter(
+            Model.canon_model_id.isnot(None),
+            Listing.status == "ACTIVE",
+            Listing.marketplace.in_(marketplaces),
+            Listing.price.isnot(None),
+        )
+        .group_by(func.grouping_sets(*SPEC_FILTERS.values(), tuple_()))
+        # the other columns are NULL within a set, so this orders each facet by its value
+        .order_by(*[column.asc() for column in SPEC_FILTERS.values()])
+        .all()
+    )
+
+    # GROUPING() sets a bit for every column not in the row's set, first column highest
+    all_bits = (1 << len(names)) - 1
+    facet_by_grouping = {all_bits ^ (1 << (len(names) - 1 - i)): name for i, name in enumerate(names)}
+
+    facets = {name: [] for name in names}
+    total = 0
+
+    for row in rows:
+        if row.grouping == all_bits:
+            total = row.total
+            continue
+
+        name = facet_by_grouping[row.grouping]
+        value = getattr(row, name)
+        count = getattr(row, f"{name}_count")
+
+        if value is None or (count == 0 and selected.get(name) != value):
+            continue
+        facets[name].append((value, count))
+
+    return facets, total
+
@@ -9,14 +9,16 @@ from flask import (
     Response
 )
 
-from app.models import Listing, Model, Specs, ThinkPadModel, PriceHistory, ModelPriceStats
+from app.models import Listing, Model, Specs, ThinkPadModel, ListingPriceChange, CanonicalPriceStats, DealsRollup
 from app import db
-from sqlalchemy.orm import joinedload
-from sqlalchemy import asc, desc, func
+from sqlalchemy import func
 from collections import OrderedDict, defaultdict
 from datetime import datetime, timezone
+import gzip
 import re
+from markupsafe import Markup
 from app.route_helpers import *
+from app.page_cache import cached_page, data_updated_at
 
 bp = Blueprint("main", __name__)
 
@@ -40,71 +42,154 @@ def robots():
     return Response("\n".join(lines), mimetype="text/plain")
 
 
-@bp.route("/sitemap.xml")
-def sitemap_xml():
-    today = datetime.now(timezone.utc).date().isoformat()
-    pages = []
+# -------------------------------------------------
+# Sitemaps
+# /sitemap.xml is an index of the child sitemaps: the static pages and one
+# per country. Children are served plain or gzipped (.xml.gz); each is built
+# from at most one query and kept in the page cache until data_version moves.
+# -------------------------------------------------
+
+STATIC_SITEMAP = "pages"
+
+# models need this many listings in a marketplace to be in its sitemap
+SITEMAP_MIN_LISTINGS = 5
+
+
+def sitemap_response(xml, compressed=False):
+    body = xml.encode("utf-8")
+    if compressed:
+        return Response(gzip.compress(body, mtime=0), mimetype="application/gzip")
+    return Response(body, mimetype="application/xml")
+
+
+def sitemap_lastmod():
+    """
+    Date of the last data load, the lastmod of pages without their own.
+    Not the clock: sitemaps stay in the page cache until the next load.
+    """
+    updated = data_updated_at() or datetime.now(timezone.utc)
+    return updated.date().isoformat()
 
-    # --- Static pages ---
+
+def static_sitemap_pages(data_lastmod):
     static_endpoints = [
-        ("main.index", {}),
-        ("main.about", {}),
-        ("main.methodology", {}),
-        ("main.privacy", {}),
-        ("main.terms", {}),
-        ("main.contact", {}),
+        "main.index",
+        "main.about",
+        "main.methodology",
+        "main.privacy",
+        "main.terms",
+        "main.contact",
     ]
 
-    for endpoint, values in static_endpoints:
-        pages.append({
-            "loc": url_for(endpoint, _external=True, **values),
-            "lastmod": today,
+    return [
+        {
+            "loc": url_for(endpoint, _external=True),
+            "lastmod": data_lastmod,
             "changefreq": "weekly",
             "priority": "0.8" if endpoint == "main.index" else "0.5",
+        }
+        for endpoint in static_endpoints
+    ]
+
+
+def country_sitemap_pages(country, data_lastmod):
+    """The country's list pages and its model pages, with one query for the models."""
+    pages = [
+        {"loc": url_for("main.country_home", country=country, _external=True), "lastmod": data_lastmod, "changefreq": "daily", "priority": "0.9"},
+        {"loc": url_for("main.deals", country=country, _external=True), "lastmod": data_lastmod, "changefreq": "daily", "priority": "0.9"},
+        {"loc": url_for("main.best_deals", country=country, _external=True), "lastmod": data_lastmod, "changefreq": "daily", "priority": "0.8"},
+        {"loc": url_for("main.price_drops", country=country, _external=True), "lastmod": data_lastmod, "changefreq": "daily", "priority": "0.7"},
+        {"loc": url_for("main.thinkpad_models", country=country, _external=True), "lastmod": data_lastmod, "changefreq": "weekly", "priority": "0.7"},
+    ]
+
+    marketplace = get_enabled_markets().get(country)
+    if not marketplace:
+        return pages
+
+    # Include only models that have stats for the marketplace with enough listings
+    rows = (
+        db.session.query(
+            ThinkPadModel.slug,
+            CanonicalPriceStats.updated_at,
+        )
+        .join(ThinkPadModel, ThinkPadModel.id == CanonicalPriceStats.canon_model_id)
+        .filter(
+            CanonicalPriceStats.marketplace == marketplace,
+            CanonicalPriceStats.listing_count >= SITEMAP_MIN_LISTINGS,
+        )
+        .order_by(ThinkPadModel.slug.asc())
+        .all()
+    )
+
+    for row in rows:
+        lastmod = row.updated_at.date().isoformat() if row.updated_at else data_lastmod
+
+        pages.append({
+            "loc": url_for("main.model_page", country=country, model_slug=row.slug, _external=True),
+            "lastmod": lastmod,
+            "changefreq": "daily",
+            "priority": "0.8",
         })
 
-    # --- Country pages ---
-    for country in COUNTRY_FLAGS.keys():
-        pages.extend([
-            {"loc": url_for("main.deals", country=country, _external=True), "lastmod": today, "changefreq": "daily", "priority": "0.9"},
-            {"loc": url_for("main.best_deals", country=country, _external=True), "lastmod": today, "changefreq": "daily", "priority": "0.8"},
-            {"loc": url_for("main.price_drops", country=country, _external=True), "lastmod": today, "changefreq": "daily", "priority": "0.7"},
-            {"loc": url_for("main.thinkpad_models", country=country, _external=True), "lastmod": today, "changefreq": "weekly", "priority": "0.7"},
-        ])
-
-    # --- Model pages ---
-    # Include only models that have stats for the marketplace with at least 5 listings
-    models = ThinkPadModel.query.order_by(ThinkPadModel.slug.asc()).all()
-    for model in models:
-        if not model.slug:
-            continue
-        for country in COUNTRY_FLAGS.keys():
-            # Get stats for this model + marketplace
-            stats = ModelPriceStats.query.join(ModelPriceStats.model).filter(
-                ModelPriceStats.model_id == model.id,
-                ModelPriceStats.marketplace == country,
-                ModelPriceStats.listing_count >= 5
-            ).first()
-
-            if not stats:
-                continue  # skip models with too few listings in this country
-
-            lastmod = stats.updated_at.date().isoformat() if stats.updated_at else today
-
-            pages.append({
-                "loc": url_for("main.model_price", country=country, slug=model.slug, _external=True),
-                "lastmod": lastmod,
-                "changefreq": "daily",
-                "priority": "0.8",
-            })
+    return pages
+
+
+SITEMAP_ENDPOINTS = {"main.sitemap_xml", "main.sitemap_child", "main.sitemap_child_gz"}
 
-    xml = render_template("sitemap.xml", pages=pages)
-    return Response(
-        xml,
-        mimetype="application/xml",
-        headers={"Cache-Control": "public, max-age=3600"}
+
+@bp.after_request
+def sitemap_cache_control(response):
+    # set here so page cache hits get it too
+    if request.endpoint in SITEMAP_ENDPOINTS and response.status_code == 200:
+        response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+@bp.route("/sitemap.xml")
+@cached_page
+def sitemap_xml():
+    data_lastmod = sitemap_lastmod()
+
+    # last stats update per marketplace, one query for every country
+    updated = dict(
+        db.session.query(
+            CanonicalPriceStats.marketplace,
+            func.max(CanonicalPriceStats.updated_at),
+        )
+        .group_by(CanonicalPriceStats.marketplace)
+        .all()
     )
 
+    sitemaps = [{
+        "loc": url_for("main.sitemap_child_gz", name=STATIC_SITEMAP, _external=True),
+        "lastmod": data_lastmod,
+    }]
+
+    for country, marketplace in get_enabled_markets().items():
+        lastmod = updated.get(marketplace)
+        sitemaps.append({
+            "loc": url_for("main.sitemap_child_gz", name=country, _external=True),
+            "lastmod": lastmod.date().isoformat() if lastmod else data_lastmod,
+        })
+
+    return sitemap_response(render_template("sitemap_index.xml", sitemaps=sitemaps))
+
+
+@bp.route("/sitemaps/<name>.xml", defaults={"compressed": False})
+@bp.route("/sitemaps/<name>.xml.gz", defaults={"compressed": True}, endpoint="sitemap_child_gz")
+@cached_page
+def sitemap_child(name, compressed):
+    data_lastmod = sitemap_lastmod()
+
+    if name == STATIC_SITEMAP:
+        pages = static_sitemap_pages(data_lastmod)
+    elif name in get_enabled_markets():
+        pages = country_sitemap_pages(name, data_lastmod)
+    else:
+        abort(404)
+
+    return sitemap_response(render_template("sitemap.xml", pages=pages), compressed=compressed)
+
 DEFAULT_COUNTRY = "us"
 
 @bp.app_context_processor
@@ -171,6 +256,10 @@ def inject_helpers():
 
 @bp.app_template_filter("timeago")
 def timeago(dt):
+    """
+    A <time> element with the absolute date; the script in layout.html turns
+    it into "5 min ago" in the browser, so cached pages don't freeze the age.
+    """
     if not dt:
         return ""
 
@@ -178,23 +267,10 @@ def timeago(dt):
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
 
-    now = datetime.now(timezone.utc).astimezone(dt.tzinfo)
-    diff = now - dt
-    seconds = int(diff.total_seconds())
-
-    if seconds < 60:
-        return "just now"
-    elif seconds < 3600:
-        minutes = seconds // 60
-        return f"{minutes} min ago"
-    elif seconds < 86400:
-        hours = seconds // 3600
-        return f"{hours} hr ago"
-    elif seconds < 604800:
-        days = seconds // 86400
-        return f"{days} day{'s' if days != 1 else ''} ago"
-    else:
-        return dt.strftime("%d %b %Y")
+    return Markup('<time class="timeago" datetime="{}">{}</time>').format(
+        dt.astimezone(timezone.utc).isoformat(timespec="seconds"),
+        dt.strftime("%d %b %Y"),
+    )
 
 
 # -------------------------------------------------
@@ -220,6 +296,7 @@ def index():
 
 
 @bp.route("/<country>/")
+@cached_page
 def country_home(country):
     country, marketplaces, currency = get_country_context_or_404(country)
 
@@ -227,46 +304,20 @@ def country_home(country):
     direction = request.args.get("direction", "asc")
 
     # Base query
-    query = (
-        Listing.query
-        .join(Listing.model)
-        .outerjoin(Listing.specs)
-        .options(joinedload(Listing.model), joinedload(Listing.specs))
-        .filter(
-            Model.canon_model_id.isnot(None),
-            Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
-        )
-    )
+    query = base_listing_query(marketplaces)
 
     # Apply spec filters
-    for param, column in SPEC_FILTERS.items():
-        value = request.args.get(param)
-        if value not in (None, ""):
-            # Convert numeric fields to float
-            if param in ["ram", "storage"]:
-                try:
-                    value = float(value)
-                except ValueError:
-                    continue
-            query = query.filter(column == value)
-
-    # Build dropdown filters
-    filters = {}
-    for name, column in SPEC_FILTERS.items():
-        values = (
-            query.with_entities(column)
-            .distinct()
-            .order_by(column.asc().nullslast())
-            .all()
-        )
+    selected = selected_spec_filters(request.args)
+    for name, value in selected.items():
+        query = query.filter(SPEC_FILTERS[name] == value)
+
+    # Build dropdown filters: every facet's values and counts, plus the total, in one query
+    facets, total = spec_facets(marketplaces, selected)
 
+    filters = {}
+    for name, values in facets.items():
         filters[name] = []
-        for v in values:
-            val = v[0]
-            if val is None:
-                continue
-            
+        for val, count in values:
             if name in ["ram", "storage"]:
                 label = format_capacity(val)
             elif name == "storage_type":
@@ -278,7 +329,8 @@ def country_home(country):
 
             filters[name].append({
                 "value": val,    # raw numeric or string
-                "label": label   # display label
+                "label": label,  # display label
+                "count": count,  # listings under the other selected filters
             })
 
         # Minimal change: sort storage_type dropdown
@@ -296,13 +348,10 @@ def country_home(country):
     }
 
     order_col = SORT_COLUMNS.get(sort, Listing.price)
-    primary_sort = (desc(order_col) if direction == "desc" else asc(order_col)).nullslast()
-    query = query.order_by(primary_sort, Listing.price.asc())
+    sort_keys = listing_sort_keys(order_col, direction == "desc")
 
-    # Pagination
-    page = request.args.get("page", 1, type=int)
-    per_page = 50
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Keyset pagination, the total is counted by spec_facets
+    pagination = paginate_by_keys(query, sort_keys, total=total, not_null=[Listing.price])
     listings = pagination.items
 
     # Order filters consistently
@@ -328,6 +377,7 @@ def country_home(country):
 # -------------------------------------------------
 
 @bp.route("/<country>/<model_slug>/")
+@cached_page
 def model_page(country, model_slug):
     country, marketplaces, currency = get_country_context_or_404(country)
 
@@ -359,17 +409,12 @@ def model_page(country, model_slug):
     else:
         order_col = Listing.price
 
-    if direction == "desc":
-        query = query.order_by(order_col.desc())
-    else:
-        query = query.order_by(order_col.asc())
+    if direction != "desc":
         direction = "asc"
 
-    
-    page = request.args.get("page", 1, type=int)
-    per_page = 50
+    sort_keys = listing_sort_keys(order_col, direction == "desc")
 
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = paginate_by_keys(query, sort_keys, not_null=[Listing.price])
     listings = pagination.items
 
     if not listings:
@@ -419,141 +464,20 @@ def set_country(country):
 # -----------------------------
 
 @bp.route("/<country>/deals")
+@cached_page
 def deals(country):
     country, marketplaces, currency = get_market_context(country)
-    sort = request.args.get("sort", "price")
-
-    # =========================================================
-    # 1) BASE: active listings joined to parsed models
-    #    Grain = one row per listing (assuming one Model row per listing)
-    # =========================================================
-    base_q = (
-        db.session.query(
-            Model.canon_model_id.label("canon_model_id"),
-            Listing.id.label("listing_id"),
-            Listing.ebay_item_id.label("ebay_item_id"),
-            Listing.price.label("price"),
-            Listing.first_seen.label("first_seen"),
-        )
-        .join(Listing, Listing.id == Model.listing_id)
-        .filter(
-            Model.canon_model_id.isnot(None),
-            Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
-        )
-    ).subquery()
-
-    # =========================================================
-    # 2) MODEL SUMMARY: one row per canonical model
-    #    Grain = one row per canonical model
-    # =========================================================
-    model_summary = (
-        db.session.query(
-            base_q.c.canon_model_id,
-            func.min(base_q.c.price).label("cheapest_price"),
-            func.count(func.distinct(base_q.c.listing_id)).label("listing_count"),
-            func.max(base_q.c.first_seen).label("newest_listing"),
-        )
-        .group_by(base_q.c.canon_model_id)
-        .subquery()
-    )
-
-    # =========================================================
-    # 3) CHEAPEST ITEM ID per canonical model
-    #    Correlated subquery: returns one ebay_item_id per model
-    # =========================================================
-    cheapest_item_subq = (
-        db.session.query(base_q.c.ebay_item_id)
-        .filter(base_q.c.canon_model_id == model_summary.c.canon_model_id)
-        .order_by(base_q.c.price.asc(), base_q.c.first_seen.desc())
-        .limit(1)
-        .correlate(model_summary)
-        .scalar_subquery()
-    )
 
     # =========================================================
-    # 4) MAIN QUERY: one row per canonical model
+    # 1) MAIN QUERY: one row per canonical model
+    #    Read from the deals_rollup materialized view, which the
+    #    pipeline refreshes after every run
     # =========================================================
     query = (
-        db.session.query(
-            ThinkPadModel.id.label("canon_model_id"),
-            ThinkPadModel.name.label("model_name"),
-            ThinkPadModel.slug.label("slug"),
-            model_summary.c.cheapest_price,
-            model_summary.c.listing_count,
-            model_summary.c.newest_listing,
-            cheapest_item_subq.label("cheapest_item"),
-        )
-        .select_from(model_summary)
-        .join(ThinkPadModel, ThinkPadModel.id == model_summary.c.canon_model_id)
-    )
-
-    # =========================================================
-    # 5) BEST DEAL MODELS
-    #    A model is a "best deal" if any active listing is < 75% of that
-    #    model's current cheapest tracked baseline
-    # =========================================================
-    avg_subq = (
-        db.session.query(
-            base_q.c.canon_model_id,
-            func.avg(base_q.c.price).label("avg_price"),
-        )
-        .group_by(base_q.c.canon_model_id)
-        .subquery()
-    )
-
-    best_deal_rows = (
-        db.session.query(base_q.c.canon_model_id)
-        .join(avg_subq, avg_subq.c.canon_model_id == base_q.c.canon_model_id)
-        .filter(base_q.c.price < avg_subq.c.avg_price * 0.75)
-        .distinct()
-        .all()
-    )
-    best_deal_model_ids = {row[0] for row in best_deal_rows}
-
-    # =========================================================
-    # 6) Price Drop logic for badges
-    #==========================================================
-
-    # after your base_q or main query
-    price_history_max = (
-        db.session.query(
-            PriceHistory.listing_id.label("listing_id"),
-            func.max(PriceHistory.price).label("historical_max_price"),
-        )
-        .group_by(PriceHistory.listing_id)
-        .subquery()
+        db.session.query(DealsRollup)
+        .filter(DealsRollup.c.marketplace.in_(marketplaces))
     )
 
-    price_drop_rows = (
-        db.session.query(Model.canon_model_id)
-        .join(Listing, Listing.id == Model.listing_id)
-        .join(price_history_max, price_history_max.c.listing_id == Listing.id)
-        .filter(
-            Model.canon_model_id.isnot(None),
-            Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
-            Listing.price < price_history_max.c.historical_max_price,
-        )
-        .distinct()
-        .all()
-    )
-
-    price_drop_model_ids = {row[0] for row in price_drop_rows}
-    
-    # =========================================================
-    # 7) DEBUG (optional - remove later)
-    # =========================================================
-    # for row in rows:
-    #     print(
-    #         "[DEALS DEBUG]",
-    #         row.canon_model_id,
-    #         row.model_name,
-    #         row.cheapest_price,
-    #         row.listing_count,
-    #         row.cheapest_item,
-    #     )
-
     sort = request.args.get("sort", "cheapest_price")
     direction = request.args.get("direction", "asc")
 
@@ -561,28 +485,27 @@ def deals(country):
         direction = "asc"
 
     if sort == "model_name":
-        sort_col = func.lower(ThinkPadModel.name)
+        sort_col = func.lower(DealsRollup.c.model_name)
     elif sort == "listing_count":
-        sort_col = model_summary.c.listing_count
+        sort_col = DealsRollup.c.listing_count
     else:  # default
         sort = "cheapest_price"
-        sort_col = model_summary.c.cheapest_price
+        sort_col = DealsRollup.c.cheapest_price
 
-    if direction == "desc":
-        query = query.order_by(desc(sort_col))
-    else:
-        query = query.order_by(asc(sort_col))
-
-    # optional stable secondary sort
-    #query = query.order_by(func.lower(ThinkPadModel.name))
-
-    
-    page = request.args.get("page", 1, type=int)
-    per_page = 50
+    # one row per (canon_model_id, marketplace), which makes the order total
+    sort_keys = [
+        (sort_col, direction == "desc"),
+        (DealsRollup.c.canon_model_id, direction == "desc"),
+        (DealsRollup.c.marketplace, direction == "desc"),
+    ]
 
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = paginate_by_keys(query, sort_keys)
     rows = pagination.items
 
+    # badges come with the rows
+    best_deal_model_ids = {row.canon_model_id for row in rows if row.is_best_deal}
+    price_drop_model_ids = {row.canon_model_id for row in rows if row.has_price_drop}
+
     return render_template(
         "deals.html",
         rows=rows,
@@ -598,54 +521,34 @@ def deals(country):
 
 
 @bp.route("/<country>/price-drops")
+@cached_page
 def price_drops(country):
     country, marketplaces, currency = get_country_context_or_404(country)
 
-    # Previous price per listing
-    old_price = func.lag(PriceHistory.price).over(
-        partition_by=PriceHistory.listing_id,
-        order_by=(PriceHistory.recorded_at, PriceHistory.id)
-    )
-
-    # Join directly Listing → Model → ThinkPadModel
-    price_changes_subq = (
+    # Latest price change per listing, precomputed by the pipeline.
+    # Only drops of ACTIVE listings, the sort columns are indexed per marketplace.
+    rows = (
         db.session.query(
-            PriceHistory.listing_id.label("listing_id"),
-            Listing.ebay_item_id.label("ebay_item_id"),
-            Listing.item_url.label("item_url"),
-            Listing.affiliate_url.label("affiliate_url"),
-            PriceHistory.price.label("new_price"),
-            old_price.label("old_price"),
-            Listing.currency.label("currency"),
             ThinkPadModel.name.label("model_name"),
             ThinkPadModel.slug.label("slug"),
+            Listing.ebay_item_id,
+            ListingPriceChange.old_price,
+            ListingPriceChange.new_price,
+            ListingPriceChange.drop_amount,
+            ListingPriceChange.discount_percent,
+            ListingPriceChange.currency,
+            Listing.item_url,
+            Listing.affiliate_url,
         )
-        .join(Listing, Listing.id == PriceHistory.listing_id)
+        .select_from(ListingPriceChange)
+        .join(Listing, Listing.id == ListingPriceChange.listing_id)
         .join(Model, Model.listing_id == Listing.id)
         .join(ThinkPadModel, ThinkPadModel.id == Model.canon_model_id)
         .filter(
+            ListingPriceChange.marketplace.in_(marketplaces),
+            ListingPriceChange.status == "ACTIVE",
+            ListingPriceChange.new_price < ListingPriceChange.old_price,
             Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
-        )
-        .subquery()
-    )
-
-    rows = (
-        db.session.query(
-            price_changes_subq.c.model_name,
-            price_changes_subq.c.slug,
-            price_changes_subq.c.ebay_item_id,
-            price_changes_subq.c.old_price,
-            price_changes_subq.c.new_price,
-            (price_changes_subq.c.old_price - price_changes_subq.c.new_price).label("drop_amount"),
-            ((price_changes_subq.c.old_price - price_changes_subq.c.new_price) / price_changes_subq.c.old_price * 100).label("discount_percent"),
-            price_changes_subq.c.currency,
-            price_changes_subq.c.item_url,
-            price_changes_subq.c.affiliate_url,
-        )
-        .filter(
-            price_changes_subq.c.old_price.isnot(None),
-            price_changes_subq.c.new_price < price_changes_subq.c.old_price,
         )
     )
 
@@ -654,23 +557,26 @@ def price_drops(country):
     
     # SQL-level sorting
     if sort == "model_name":
-        order_col = price_changes_subq.c.model_name
+        order_col = ThinkPadModel.name
     elif sort == "old_price":
-        order_col = price_changes_subq.c.old_price
+        order_col = ListingPriceChange.old_price
     elif sort == "new_price":
-        order_col = price_changes_subq.c.new_price
-    elif sort == "discount_percent":
-        order_col = ((price_changes_subq.c.old_price - price_changes_subq.c.new_price) / price_changes_subq.c.old_price * 100)
+        order_col = ListingPriceChange.new_price
     else:
-        order_col = ((price_changes_subq.c.old_price - price_changes_subq.c.new_price) / price_changes_subq.c.old_price * 100)
-
-    primary_sort = desc(order_col) if direction == "desc" else asc(order_col)
+        order_col = ListingPriceChange.discount_percent
 
-    rows = rows.order_by(primary_sort, (price_changes_subq.c.old_price - price_changes_subq.c.new_price).asc())
-    page = request.args.get("page", 1, type=int)
-    per_page = 50
+    sort_keys = [
+        (order_col, direction == "desc"),
+        (ListingPriceChange.drop_amount, direction == "desc"),
+        (ListingPriceChange.listing_id, direction == "desc"),
+    ]
 
-    pagination = rows.paginate(page=page, per_page=per_page, error_out=False)
+    # new_price < old_price leaves no NULL prices, drops or percentages
+    pagination = paginate_by_keys(
+        rows,
+        sort_keys,
+        not_null=[order_col, ListingPriceChange.drop_amount],
+    )
     rows = pagination.items
 
     return render_template(
@@ -686,65 +592,45 @@ def price_drops(country):
 
 
 @bp.route("/<country>/best-deals")
+@cached_page
 def best_deals(country):
     country, marketplaces, currency = get_market_context(country)
 
     # =========================================================
-    # 1) BASE: active listings with canonical model
-    # =========================================================
-    base_q = (
-        db.session.query(
-            Model.canon_model_id.label("canon_model_id"),
-            Model.id.label("model_id"),
-            Listing.id.label("listing_id"),
-            Listing.ebay_item_id.label("ebay_item_id"),
-            Listing.title.label("title"),
-            Listing.price.label("price"),
-            Listing.first_seen.label("first_seen"),
-            Listing.item_url.label("item_url"),
-            Listing.affiliate_url.label("affiliate_url"),
-        )
-        .join(Listing, Listing.id == Model.listing_id)
-        .filter(
-            Model.canon_model_id.isnot(None),
-            Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
-        )
-    ).subquery()
-
-    # =========================================================
-    # 2) Average price per canonical model
+    # 1) Active listings below 85% of their model's average price
+    #    Averages come precomputed from canonical_price_stats
     # =========================================================
-    avg_subq = (
-        db.session.query(
-            base_q.c.canon_model_id,
-            func.avg(base_q.c.price).label("avg_price"),
-        )
-        .group_by(base_q.c.canon_model_id)
-        .subquery()
-    )
+    avg_price = CanonicalPriceStats.avg_price
+    discount_percent = (avg_price - Listing.price) / avg_price * 100
 
-    # =========================================================
-    # 3) Build query (DO NOT call .all() yet)
-    # =========================================================
     query = (
         db.session.query(
-            base_q.c.listing_id,
-            base_q.c.ebay_item_id,
-            base_q.c.title,
-            base_q.c.price,
-            base_q.c.item_url,
-            base_q.c.affiliate_url,
-            avg_subq.c.avg_price,
+            Listing.id.label("listing_id"),
+            Listing.ebay_item_id,
+            Listing.title,
+            Listing.price,
+            Listing.item_url,
+            Listing.affiliate_url,
+            avg_price.label("avg_price"),
             ThinkPadModel.id.label("canon_model_id"),
             ThinkPadModel.name.label("model_name"),
             ThinkPadModel.slug.label("slug"),
-            ((avg_subq.c.avg_price - base_q.c.price) / avg_subq.c.avg_price).label("discount_ratio"),
-            ((avg_subq.c.avg_price - base_q.c.price) / avg_subq.c.avg_price * 100).label("discount_percent"),
+            ((avg_price - Listing.price) / avg_price).label("discount_ratio"),
+            discount_percent.label("discount_percent"),
+        )
+        .select_from(Listing)
+        .join(Model, Model.listing_id == Listing.id)
+        .join(
+            CanonicalPriceStats,
+            (CanonicalPriceStats.canon_model_id == Model.canon_model_id)
+            & (CanonicalPriceStats.marketplace == Listing.marketplace),
+        )
+        .join(ThinkPadModel, ThinkPadModel.id == Model.canon_model_id)
+        .filter(
+            Listing.status == "ACTIVE",
+            Listing.marketplace.in_(marketplaces),
+            Listing.price < avg_price * 0.85,
         )
-        .join(avg_subq, avg_subq.c.canon_model_id == base_q.c.canon_model_id)
-        .join(ThinkPadModel, ThinkPadModel.id == base_q.c.canon_model_id)
-        .filter(base_q.c.price < avg_subq.c.avg_price * 0.85)
     )
 
     sort = request.args.get("sort", "discount")
@@ -754,22 +640,16 @@ def best_deals(country):
     if sort == "model":
         order_col = ThinkPadModel.name
     elif sort == "price":
-        order_col = base_q.c.price
+        order_col = Listing.price
     elif sort == "avg_price":
-        order_col = avg_subq.c.avg_price
-    elif sort == "discount":
-        order_col = ((avg_subq.c.avg_price - base_q.c.price) / avg_subq.c.avg_price * 100)
+        order_col = avg_price
     else:
-        order_col = ((avg_subq.c.avg_price - base_q.c.price) / avg_subq.c.avg_price * 100)
-
-    primary_sort = desc(order_col) if direction == "desc" else asc(order_col)
+        order_col = discount_percent
 
-    query = query.order_by(primary_sort, base_q.c.price.asc())
+    sort_keys = listing_sort_keys(order_col, direction == "desc")
 
-    page = request.args.get("page", 1, type=int)
-    per_page = 50
-
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # the filter on Listing.price < avg_price * 0.85 keeps every key NOT NULL
+    pagination = paginate_by_keys(query, sort_keys, not_null=[order_col, Listing.price])
     rows = pagination.items
 
     return render_template(
@@ -784,21 +664,23 @@ def best_deals(country):
     )
 
 @bp.route("/<country>/thinkpad_models")
+@cached_page
 def thinkpad_models(country):
     country, marketplaces, currency = get_country_context_or_404(country)
 
+    # Models with active listings in the marketplace: one canonical_price_stats
+    # row each, so no aggregate over all listings
     rows = (
         db.session.query(
             ThinkPadModel.name.label("name"),
             ThinkPadModel.slug.label("slug"),
-            func.max(Listing.last_seen).label("last_seen"),
+            func.max(CanonicalPriceStats.last_seen).label("last_seen"),
         )
-        .select_from(Listing)
-        .join(Model, Model.listing_id == Listing.id)
-        .join(ThinkPadModel, ThinkPadModel.id == Model.canon_model_id)
+        .select_from(CanonicalPriceStats)
+        .join(ThinkPadModel, ThinkPadModel.id == CanonicalPriceStats.canon_model_id)
         .filter(
-            Listing.status == "ACTIVE",
-            Listing.marketplace.in_(marketplaces),
+            CanonicalPriceStats.marketplace.in_(marketplaces),
+            CanonicalPriceStats.listing_count > 0,
         )
         .group_by(ThinkPadModel.id, ThinkPadModel.name, ThinkPadModel.slug)
         .order_by(ThinkPadModel.name.asc())
@@ -914,6 +796,7 @@ def deal_score(listing): # add this later
 # .order_by(Listing.deal_score.desc())
 
 @bp.route("/<country>/best/under-300/")
+@cached_page
 def best_under_300(country):
     country, marketplaces, currency = get_country_context_or_404(country)
     query = base_listing_query(marketplaces).filter(Listing.price <= 300)
@@ -929,17 +812,9 @@ def best_under_300(country):
 
     order_col = SORT_COLUMNS.get(sort, Listing.price)
 
-    primary_sort = (
-        desc(order_col) if direction == "desc"
-        else asc(order_col)
-    ).nullslast()
-
-    query = query.order_by(primary_sort, Listing.price.asc())
-
-    page = request.args.get("page", 1, type=int)
-    per_page = 50
+    sort_keys = listing_sort_keys(order_col, direction == "desc")
 
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = paginate_by_keys(query, sort_keys, not_null=[Listing.price])
     listings = pagination.items
 
     return render_template(
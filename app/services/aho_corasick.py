@@ -0,0 +1,78 @@
+# AHO-CORASICK AUTOMATON FOR MATCHING MANY PHRASES IN ONE PASS
+
+
+class Automaton:
+    """
+    Character-level Aho-Corasick automaton.
+
+    Add every key with a value, call build() once, then iter_matches() finds
+    every occurrence of every key in a single pass over the text, however
+    many keys there are.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def __len__(self):
+        return sum(len(out) for out in self._out)
+
+    def add(self, key, value=None):
+        if not key:
+            return
+
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][ch] = nxt
+            node = nxt
+
+        self._out[node].append((len(key), value))
+        self._built = False
+
+    def build(self):
+        # breadth first, so every fail target is finished before it is used
+        queue = list(self._goto[0].values())
+
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """Yield (start, end, value) for every key occurrence in text."""
+        if not self._built:
+            self.build()
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        node = 0
+
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for length, value in out[node]:
+                yield i + 1 - length, i + 1, value
+
+    def search(self, text):
+        """First (start, end, value) found in text, or None."""
+        return next(self.iter_matches(text), None)
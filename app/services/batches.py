@@ -0,0 +1,87 @@
+# FETCH BATCHES: STAGING REGISTRY FOR temp_summaries / temp_details
+# Each fetch run loads its rows under its own batch id, so several workers
+# (per marketplace or per query) can load at the same time. The pipeline
+# processes one LOADED batch, and old batches are removed with their rows.
+
+from sqlalchemy import text
+
+from app import db
+
+# LOADING / LOADED batches older than this are from runs that died
+STALE_BATCH_HOURS = 24
+
+# processed batches kept around for debugging
+KEEP_PROCESSED_BATCHES = 3
+
+
+def open_batch(marketplaces):
+    """Register a new batch for the given marketplaces and return its id."""
+    batch_id = db.session.execute(text(r"""
+        INSERT INTO fetch_batches (marketplaces, status)
+        VALUES (:marketplaces, 'LOADING')
+        RETURNING id;
+    """), {"marketplaces": list(marketplaces)}).scalar()
+    db.session.commit()
+
+    print(f"Opened batch {batch_id} for {', '.join(marketplaces)}.")
+    return batch_id
+
+
+def close_batch(batch_id):
+    """Mark a batch as fully loaded so the pipeline may process it."""
+    item_count = db.session.execute(text(r"""
+        UPDATE fetch_batches
+        SET
+            status = 'LOADED',
+            loaded_at = NOW(),
+            item_count = (
+                SELECT COUNT(*)
+                FROM temp_summaries
+                WHERE batch_id = :batch_id
+            )
+        WHERE id = :batch_id
+        AND status = 'LOADING'
+        RETURNING item_count;
+    """), {"batch_id": batch_id}).scalar()
+    db.session.commit()
+
+    print(f"Closed batch {batch_id} with {item_count} summaries.")
+    return item_count
+
+
+def mark_batch_processed(batch_id):
+    """Part of the pipeline transaction, so a failed run leaves the batch LOADED."""
+    db.session.execute(text(r"""
+        UPDATE fetch_batches
+        SET
+            status = 'PROCESSED',
+            processed_at = NOW()
+        WHERE id = :batch_id;
+    """), {"batch_id": batch_id})
+
+
+def drop_old_batches(keep_processed=KEEP_PROCESSED_BATCHES, stale_hours=STALE_BATCH_HOURS):
+    """
+    Delete processed batches beyond the newest keep_processed, and batches
+    that never finished loading or processing within stale_hours. Their
+    staging rows go with them (ON DELETE CASCADE); the staging tables are
+    UNLOGGED, so this writes no WAL.
+    """
+    result = db.session.execute(text(r"""
+        DELETE FROM fetch_batches
+        WHERE id IN (
+            SELECT id
+            FROM fetch_batches
+            WHERE status = 'PROCESSED'
+            ORDER BY processed_at DESC
+            OFFSET :keep_processed
+        )
+        OR (
+            status IN ('LOADING', 'LOADED')
+            AND started_at < NOW() - make_interval(hours => :stale_hours)
+        );
+    """), {"keep_processed": keep_processed, "stale_hours": stale_hours})
+    db.session.commit()
+
+    print(f"Dropped {result.rowcount} old batches.")
+    return result.rowcount
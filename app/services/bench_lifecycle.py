@@ -0,0 +1,241 @@
+# BENCHMARK: SINGLE-STATEMENT LISTING LIFECYCLE VS THE FIVE SEPARATE STEPS
+# run with: python -m app.services.bench_lifecycle [--rows N] [--batch-share F]
+#
+# The five separate steps the pipeline used to run are kept below as the reference
+# implementation. Everything happens in TEMP tables named listings, fetch_batches,
+# temp_summaries and listing_price_changes. They shadow the real tables for this
+# session only, so both versions run unchanged against synthetic data, and the
+# transaction is rolled back at the end.
+
+import argparse
+import time
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.services.pipeline import update_listing_lifecycle
+
+
+# --------------------------
+# Reference: the lifecycle as five separate steps
+# --------------------------
+
+# update the price if it has changed
+def update_listing_prices(batch_id):
+    db.session.execute(text(r"""
+        UPDATE listings l
+        SET
+            price = ts.price,
+            last_updated = NOW()
+        FROM temp_summaries ts
+        WHERE ts.batch_id = :batch_id
+        AND l.ebay_item_id = ts.ebay_item_id
+        AND l.status = 'ACTIVE'
+        AND l.price <> ts.price;
+    """), {"batch_id": batch_id})
+
+def mark_sold_listings(batch_id):
+    """
+    Mark listings as ENDED if temp_summaries.sold_at is not NULL.
+    """
+    result = db.session.execute(text(r"""
+        UPDATE listings l
+        SET
+            status = 'ENDED',
+            ended_at = ts.sold_at,
+            last_updated = NOW()
+        FROM temp_summaries ts
+        WHERE ts.batch_id = :batch_id
+        AND l.ebay_item_id = ts.ebay_item_id
+        AND ts.sold_at IS NOT NULL
+        AND l.status != 'ENDED';
+    """), {"batch_id": batch_id})
+    print(f"Marked {result.rowcount} listings as sold.")
+
+# update last_seen, miss_count, last_updated 
+# each time a listing appears from api
+def update_seen_listings(batch_id):
+    db.session.execute(text(r"""
+        UPDATE listings l
+        SET
+            last_seen = NOW(),
+            miss_count = 0,
+            last_updated = NOW()
+        FROM temp_summaries ts
+        WHERE ts.batch_id = :batch_id
+        AND l.ebay_item_id = ts.ebay_item_id
+        AND l.status = 'ACTIVE';
+    """), {"batch_id": batch_id})
+
+# increment the miss_count so listings can be marked as ended.
+# only marketplaces the batch covered count as a miss
+def increment_miss_count(batch_id):
+    db.session.execute(text(r"""
+        UPDATE listings l
+        SET
+            miss_count = miss_count + 1,
+            last_updated = NOW()
+        FROM fetch_batches b
+        WHERE b.id = :batch_id
+        AND l.status = 'ACTIVE'
+        AND l.marketplace = ANY(b.marketplaces)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM temp_summaries ts
+            WHERE ts.batch_id = :batch_id
+            AND ts.ebay_item_id = l.ebay_item_id
+        );
+    """), {"batch_id": batch_id})
+
+# change status to ended for listings
+def mark_ended_listings(batch_id):
+    result = db.session.execute(text(r"""
+        UPDATE listings l
+        SET
+            status = 'ENDED',
+            ended_at = NOW(),
+            last_updated = NOW()
+        FROM fetch_batches b
+        WHERE b.id = :batch_id
+        AND l.status = 'ACTIVE'
+        AND l.marketplace = ANY(b.marketplaces)
+        AND l.miss_count >= 3;
+    """), {"batch_id": batch_id})
+    print(f"Marked {result.rowcount} listings as ended.")
+
+
+SEQUENCE = [
+    update_listing_prices,
+    mark_sold_listings,
+    update_seen_listings,
+    increment_miss_count,
+    mark_ended_listings,
+]
+
+BATCH_ID = 1
+
+# what the steps are allowed to change, compared between the two runs
+RESULT_COLUMNS = "id, price, status, ended_at, last_seen, miss_count, last_updated"
+
+
+def create_synthetic_tables(rows, batch_share):
+    """
+    rows listings: 90% ACTIVE with miss counts 0-3, the rest ENDED.
+    batch_share of them show up in temp_summaries, 10% of those with a new
+    price and 1% sold.
+    """
+    # temp tables live in local buffers, the 8MB default would make this an I/O benchmark
+    db.session.execute(text("SET temp_buffers = '1GB';"))
+
+    db.session.execute(text(r"""
+        CREATE TEMP TABLE listings_seed (LIKE listings INCLUDING DEFAULTS);
+        CREATE TEMP TABLE listings (LIKE listings INCLUDING ALL);
+        CREATE TEMP TABLE fetch_batches (LIKE fetch_batches INCLUDING ALL);
+        CREATE TEMP TABLE temp_summaries (LIKE temp_summaries INCLUDING ALL);
+        CREATE TEMP TABLE listing_price_changes (LIKE listing_price_changes INCLUDING ALL);
+    """))
+
+    db.session.execute(text(r"""
+        INSERT INTO fetch_batches (id, marketplaces, status)
+        VALUES (:batch_id, ARRAY['EBAY_US'], 'LOADED');
+    """), {"batch_id": BATCH_ID})
+
+    db.session.execute(text(r"""
+        INSERT INTO listings_seed (
+            id, ebay_item_id, title, price, currency, marketplace,
+            status, first_seen, last_seen, last_updated, miss_count
+        )
+        SELECT
+            i,
+            'item-' || i,
+            'Lenovo ThinkPad T480 ' || i,
+            100 + (i % 900),
+            'USD',
+            'EBAY_US',
+            CASE WHEN i % 10 = 0 THEN 'ENDED' ELSE 'ACTIVE' END,
+            NOW() - INTERVAL '30 days',
+            NOW() - INTERVAL '1 day',
+            NOW() - INTERVAL '1 day',
+            i % 4
+        FROM generate_series(1, :rows) AS i;
+    """), {"rows": rows})
+
+    db.session.execute(text(r"""
+        INSERT INTO temp_summaries (
+            batch_id, category_id, ebay_item_id, title, price, currency, marketplace, sold_at
+        )
+        SELECT
+            :batch_id,
+            '177',
+            ebay_item_id,
+            title,
+            CASE WHEN id % 10 = 1 THEN price - 10 ELSE price END,
+            currency,
+            marketplace,
+            CASE WHEN id % 100 = 2 THEN NOW() - INTERVAL '1 hour' END
+        FROM listings_seed
+        WHERE random() < :share;
+    """), {"batch_id": BATCH_ID, "share": batch_share})
+
+    db.session.execute(text("ANALYZE temp_summaries;"))
+
+
+def reset_listings():
+    db.session.execute(text(r"""
+        TRUNCATE listings;
+        INSERT INTO listings SELECT * FROM listings_seed;
+        ANALYZE listings;
+    """))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn(BATCH_ID)
+    return time.perf_counter() - start
+
+
+def main(rows=1_000_000, batch_share=0.3):
+    app = create_app()
+    with app.app_context():
+        try:
+            start = time.perf_counter()
+            create_synthetic_tables(rows, batch_share)
+            batch = db.session.execute(text("SELECT COUNT(*) FROM temp_summaries;")).scalar()
+            print(f"{rows} listings, {batch} in the batch, setup {time.perf_counter() - start:.1f} s")
+
+            # current sequence, each statement holds its row locks until commit
+            reset_listings()
+            step_times = [(fn.__name__, timed(fn)) for fn in SEQUENCE]
+            db.session.execute(text(f"CREATE TEMP TABLE result_sequence AS SELECT {RESULT_COLUMNS} FROM listings;"))
+
+            reset_listings()
+            single_time = timed(update_listing_lifecycle)
+            db.session.execute(text(f"CREATE TEMP TABLE result_single AS SELECT {RESULT_COLUMNS} FROM listings;"))
+
+            # NOW() is the transaction start, so both runs must match exactly
+            diff = db.session.execute(text(r"""
+                SELECT COUNT(*) FROM (
+                    (SELECT * FROM result_sequence EXCEPT SELECT * FROM result_single)
+                    UNION ALL
+                    (SELECT * FROM result_single EXCEPT SELECT * FROM result_sequence)
+                ) d;
+            """)).scalar()
+
+            sequence_time = sum(t for _, t in step_times)
+            print()
+            for name, t in step_times:
+                print(f"  {name:<24} {t:.3f} s")
+            print(f"five statements:           {sequence_time:.3f} s")
+            print(f"update_listing_lifecycle:  {single_time:.3f} s")
+            print(f"speedup:                   {sequence_time / single_time:.1f}x")
+            print(f"rows that differ:          {diff}")
+        finally:
+            db.session.rollback()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the listing lifecycle update.")
+    arg_parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic listings")
+    arg_parser.add_argument("--batch-share", type=float, default=0.3, help="share of listings in the scrape")
+    args = arg_parser.parse_args()
+    main(rows=args.rows, batch_share=args.batch_share)
@@ -0,0 +1,71 @@
+# BENCHMARK: COMPILED MODEL MATCHER VS THE OLD PER-MODEL REGEX LOOP
+# run with: python -m app.services.bench_model_matcher
+
+import os
+import re
+import time
+
+from app.services.model_matcher import ModelMatcher
+from app.services.title_parse import normalize_title, thinkpad_window
+from app.services.titles import titles
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_LIST_PATH = os.path.join(BASE_DIR, "model_list.txt")
+
+
+def load_known_models(filepath=MODEL_LIST_PATH):
+    """{name: fake id} from model_list.txt, so no database is needed."""
+    with open(filepath, "r", encoding="utf-8") as f:
+        names = [line.strip() for line in f if line.strip()]
+    return {name: i for i, name in enumerate(dict.fromkeys(names), start=1)}
+
+
+def loop_match(window, known_models, sorted_models):
+    """The previous implementation: one regex per model, longest first."""
+    for model in sorted_models:
+        if re.search(rf"\b{re.escape(model.lower())}\b", window):
+            return model, known_models[model]
+    return None, None
+
+
+def timed(fn, windows, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for window in windows:
+            fn(window)
+    return time.perf_counter() - start
+
+
+def main(rounds=5):
+    known_models = load_known_models()
+    sorted_models = sorted(known_models, key=len, reverse=True)
+
+    start = time.perf_counter()
+    matcher = ModelMatcher(known_models)
+    build_time = time.perf_counter() - start
+
+    windows = [thinkpad_window(normalize_title(t)) for t in titles]
+    windows = [w for w in windows if w is not None]
+
+    # both must agree on every title before timing means anything
+    mismatches = [
+        w for w in windows
+        if loop_match(w, known_models, sorted_models) != matcher.match(w)
+    ]
+    if mismatches:
+        print(f"{len(mismatches)} mismatches, e.g. {mismatches[:5]}")
+        return
+
+    loop_time = timed(lambda w: loop_match(w, known_models, sorted_models), windows, rounds)
+    matcher_time = timed(matcher.match, windows, rounds)
+    n = len(windows) * rounds
+
+    print(f"{len(known_models)} models, {len(windows)} titles, {rounds} rounds")
+    print(f"matcher build: {build_time * 1000:.1f} ms")
+    print(f"regex loop:    {loop_time:.3f} s ({loop_time / n * 1e6:.1f} us/title)")
+    print(f"matcher:       {matcher_time:.3f} s ({matcher_time / n * 1e6:.1f} us/title)")
+    print(f"speedup:       {loop_time / matcher_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# COMPILED BLACKLIST MATCHER, RELOADED WHEN THE BLACKLIST FILE CHANGES
+
+import logging
+import os
+import threading
+
+from app.services.aho_corasick import Automaton
+
+
+def read_blacklist(path):
+    """
+    Blacklist phrases from a file.
+    - One entry per line
+    - Lines starting with '#' are ignored as comments
+    - Case-insensitive (converted to lowercase)
+    """
+    phrases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue  # skip empty lines or comments
+            phrases.append(line.lower())
+    return phrases
+
+
+class BlacklistMatcher:
+    """
+    Same result as any(phrase in title.lower() for phrase in phrases), but
+    every phrase is matched in a single pass over the title, so the cost per
+    title does not grow with the size of the blacklist.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = list(dict.fromkeys(phrases))
+
+        self.automaton = Automaton()
+        for phrase in self.phrases:
+            self.automaton.add(phrase, phrase)
+        self.automaton.build()
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def match(self, title):
+        """The first blacklisted phrase found in title, or None."""
+        if not title or not self.phrases:
+            return None
+
+        found = self.automaton.search(title.lower())
+        return found[2] if found else None
+
+    def is_blacklisted(self, title):
+        return self.match(title) is not None
+
+    def filter_titles(self, titles):
+        """Yield the titles that are not blacklisted."""
+        for title in titles:
+            if not self.is_blacklisted(title):
+                yield title
+
+    def filter_items(self, items, key="title"):
+        """Yield the item dicts whose item[key] is not blacklisted."""
+        for item in items:
+            if not self.is_blacklisted(item.get(key)):
+                yield item
+
+
+class BlacklistFile:
+    """
+    Compiles the blacklist file once and keeps the matcher until the file's
+    mtime or size changes. A missing file gives an empty matcher.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = object()
+        self._matcher = None
+
+    def stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self):
+        """Current matcher, recompiled only if the file changed since the last call."""
+        stamp = self.stamp()
+        if stamp == self._stamp:
+            return self._matcher
+
+        with self._lock:
+            if stamp != self._stamp:
+                try:
+                    phrases = read_blacklist(self.path)
+                except FileNotFoundError:
+                    logging.warning(f"Warning: Blacklist file '{self.path}' not found. Continuing without blacklist.")
+                    phrases = []
+
+                self._matcher = BlacklistMatcher(phrases)
+                self._stamp = stamp
+
+        return self._matcher
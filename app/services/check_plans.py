@@ -0,0 +1,309 @@
+# QUERY PLAN CHECK FOR THE PUBLIC ROUTES
+# run with: python -m app.services.check_plans [--listings N] [--verbose]
+#
+# Seeds TEMP tables named like the real ones (listings, models, specs, ...) with
+# synthetic data at production scale. They shadow the real tables for this session
+# only and are created LIKE them INCLUDING ALL, so they carry the real indexes.
+# Every route in CHECKS is then requested through the test client on the same
+# connection, each SELECT it runs is EXPLAINed, and the check fails (exit 1) when
+# a plan reads a large table with a Seq Scan. Nothing is written; the transaction
+# is rolled back at the end.
+
+import argparse
+import json
+import re
+import sys
+
+from sqlalchemy import event, text
+
+from app import create_app, db
+from app.page_cache import page_cache
+
+# tables shadowed by the synthetic data
+SEEDED_TABLES = [
+    "model_list",
+    "listings",
+    "models",
+    "specs",
+    "price_stats_entries",
+    "canonical_price_stats",
+    "listing_price_changes",
+    "deals_rollup",
+    "data_version",
+]
+
+# a Seq Scan on a table this small is what the planner should do
+SMALL_TABLE_ROWS = 10_000
+
+# one canonical_price_stats and deals_rollup row per model and marketplace,
+# so with four marketplaces both are above SMALL_TABLE_ROWS and get checked
+CANONICAL_MODELS = 3_000
+
+# COUNT(*) and the facet GROUPING SETS read every matching row by design; they
+# run once per data_version (keyset.cached_count) or once per cached page
+FULL_READ_QUERY = re.compile(r"^SELECT count\(\*\)|GROUPING SETS", re.IGNORECASE)
+
+# tables a route reads in full by design
+EXPECTED_FULL_READS = {
+    # the discount is relative to each model's average price, so every
+    # active listing of the marketplace is joined to its model first
+    "/us/best-deals": {"models"},
+    # last stats update of every marketplace, once per data_version (the
+    # sitemap index is in the page cache), over one row per model and marketplace
+    "/sitemap.xml": {"canonical_price_stats"},
+}
+
+CHECKS = [
+    "/us/",
+    "/us/?sort=cpu",
+    "/us/?sort=model",
+    "/us/?ram=16",
+    "/de/",
+    "/us/thinkpad-t480/",
+    "/us/deals",
+    "/us/deals?sort=listing_count&direction=desc",
+    "/us/price-drops",
+    "/us/price-drops?sort=new_price&direction=asc",
+    "/us/best-deals",
+    "/us/best/under-300/",
+    "/us/thinkpad_models",
+    "/sitemap.xml",
+    "/sitemaps/us.xml",
+]
+
+# the Next link of a list page, followed once per check to plan the keyset query
+NEXT_LINK = re.compile(r'class="page-link next-link"\s+href="([^"]+)"')
+
+
+def create_synthetic_tables(listings):
+    """
+    listings rows over four marketplaces, 85% ACTIVE; one model and one specs row
+    per listing, CANONICAL_MODELS canonical models (a tenth of the listings are
+    T480s, so its model page has several pages), and the derived stats and
+    deals_rollup.
+    """
+    # read before the temp tables exist: once they shadow listings, models etc.
+    # the definition would name public.listings to keep reading the real ones
+    view_query = db.session.execute(text(r"""
+        SELECT pg_get_viewdef('public.deals_rollup'::regclass);
+    """)).scalar()
+
+    for table in SEEDED_TABLES:
+        db.session.execute(text(f"CREATE TEMP TABLE {table} (LIKE {table} INCLUDING ALL);"))
+
+    db.session.execute(text(r"""
+        INSERT INTO model_list (id, name, slug)
+        SELECT i, 'T' || (400 + i), 'thinkpad-t' || (400 + i)
+        FROM generate_series(1, :models) AS i;
+
+        UPDATE model_list SET name = 'T480', slug = 'thinkpad-t480' WHERE id = 80;
+    """), {"models": CANONICAL_MODELS})
+
+    db.session.execute(text(r"""
+        INSERT INTO listings (
+            id, ebay_item_id, title, price, currency, marketplace,
+            status, first_seen, last_seen, last_updated, miss_count
+        )
+        SELECT
+            i,
+            'item-' || i,
+            'Lenovo ThinkPad ' || i,
+            round((50 + random() * 1450)::numeric, 2),
+            'USD',
+            (ARRAY['EBAY_US', 'EBAY_GB', 'EBAY_DE', 'EBAY_AU'])[1 + i % 4],
+            CASE WHEN i % 7 = 0 THEN 'ENDED' ELSE 'ACTIVE' END,
+            NOW() - make_interval(days => i % 60),
+            NOW() - make_interval(hours => i % 48),
+            NOW(),
+            0
+        FROM generate_series(1, :listings) AS i;
+    """), {"listings": listings})
+
+    db.session.execute(text(r"""
+        INSERT INTO models (id, listing_id, name, canon_model_id)
+        SELECT
+            id,
+            id,
+            'T' || (400 + canon_model_id),
+            CASE WHEN id % 23 = 0 THEN NULL ELSE canon_model_id END
+        FROM (
+            SELECT id, CASE WHEN id % 10 = 0 THEN 80 ELSE id / 4 % :models + 1 END AS canon_model_id
+            FROM listings
+        ) l;
+
+        INSERT INTO specs (
+            id, listing_id, cpu, ram, storage, storage_type,
+            ram_processed, storage_processed, storage_type_processed
+        )
+        SELECT
+            id,
+            id,
+            (ARRAY['i5-8350U', 'i7-8650U', 'i5-10210U', 'i7-1165G7', 'Ryzen 5 Pro 4650U', NULL])[1 + id % 6],
+            (ARRAY[8, 16, 32, NULL])[1 + id % 4],
+            (ARRAY[256, 512, 1024])[1 + id % 3],
+            (ARRAY['SSD', 'NVMe', 'HDD'])[1 + id % 3],
+            true, true, true
+        FROM listings;
+    """), {"models": CANONICAL_MODELS})
+
+    db.session.execute(text(r"""
+        INSERT INTO price_stats_entries (listing_id, model_id, canon_model_id, marketplace, price)
+        SELECT l.id, m.id, m.canon_model_id, l.marketplace, l.price
+        FROM listings l
+        JOIN models m
+          ON m.listing_id = l.id
+        WHERE l.status = 'ACTIVE';
+
+        INSERT INTO canonical_price_stats (
+            canon_model_id, marketplace, listing_count, min_price, avg_price,
+            max_price, median_price, newest_listing, last_seen, cheapest_item, updated_at
+        )
+        SELECT
+            e.canon_model_id,
+            e.marketplace,
+            COUNT(*),
+            MIN(e.price),
+            AVG(e.price),
+            MAX(e.price),
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY e.price),
+            NOW(),
+            NOW(),
+            MIN(e.listing_id)::text,
+            NOW()
+        FROM price_stats_entries e
+        WHERE e.canon_model_id IS NOT NULL
+        GROUP BY e.canon_model_id, e.marketplace;
+
+        INSERT INTO listing_price_changes (
+            listing_id, marketplace, currency, new_price, old_price,
+            drop_amount, discount_percent, changed_at, status
+        )
+        SELECT
+            id,
+            marketplace,
+            currency,
+            price,
+            price + 10 + id % 90,
+            10 + id % 90,
+            round((10 + id % 90) / (price + 10 + id % 90) * 100, 2),
+            NOW(),
+            status
+        FROM listings
+        WHERE id % 5 = 0;
+
+        INSERT INTO data_version (id, version, updated_at)
+        VALUES (1, 1, NOW());
+    """))
+
+    # the materialized view's own query, run against the tables above
+    db.session.execute(text(f"INSERT INTO deals_rollup {view_query.rstrip().rstrip(';')};"))
+
+    for table in SEEDED_TABLES:
+        db.session.execute(text(f"ANALYZE {table};"))
+
+
+def table_sizes():
+    """Estimated rows per table name, the seeded temp tables taking precedence."""
+    rows = db.session.execute(text(r"""
+        SELECT c.relname, c.reltuples, n.nspname LIKE 'pg_temp%' AS is_temp
+        FROM pg_class c
+        JOIN pg_namespace n
+          ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'p', 'm')
+        AND (n.nspname = 'public' OR n.oid = pg_my_temp_schema());
+    """)).all()
+
+    sizes = {}
+    for name, reltuples, is_temp in sorted(rows, key=lambda row: row.is_temp):
+        sizes[name] = reltuples
+    return sizes
+
+
+def seq_scans(plan):
+    """Relation names read by Seq Scan nodes anywhere in the plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def capture_selects(client, path):
+    """(statement, parameters) of every SELECT run for path and for its next page."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+
+        next_link = NEXT_LINK.search(response.get_data(as_text=True))
+        if next_link:
+            client.get(next_link.group(1).replace("&amp;", "&"))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    return statements
+
+
+def explain(statement, parameters):
+    result = db.session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def main(listings=200_000, verbose=False):
+    app = create_app()
+    page_cache.store = None  # every request must reach the database
+
+    failures = 0
+
+    # requests reuse this app context, so they run on its session and see the temp tables
+    with app.app_context():
+        try:
+            create_synthetic_tables(listings)
+            sizes = table_sizes()
+            client = app.test_client()
+
+            for path in CHECKS:
+                for statement, parameters in capture_selects(client, path):
+                    plan = explain(statement, parameters)
+                    large = [
+                        name for name in seq_scans(plan)
+                        if sizes.get(name, 0) >= SMALL_TABLE_ROWS
+                        and name not in EXPECTED_FULL_READS.get(path, ())
+                    ]
+                    query = " ".join(statement.split())[:100]
+
+                    if large and FULL_READ_QUERY.search(statement.lstrip()):
+                        if verbose:
+                            print(f"  full    {path:<48} {', '.join(large)}")
+                        continue
+
+                    if large:
+                        failures += 1
+                        print(f"SEQ SCAN  {path:<48} on {', '.join(large)}")
+                        print(f"          {query}")
+                    elif verbose:
+                        print(f"  ok      {path:<48} {plan['Node Type']}, cost {plan['Total Cost']:.0f}")
+        finally:
+            db.session.rollback()
+
+    print(f"{len(CHECKS)} routes checked, {failures} plans with a sequential scan on a large table.")
+    return failures
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Fail if a route query plans a sequential scan on a large table.")
+    arg_parser.add_argument("--listings", type=int, default=200_000, help="synthetic listings to seed")
+    arg_parser.add_argument("--verbose", action="store_true", help="print every checked plan")
+    args = arg_parser.parse_args()
+    sys.exit(1 if main(listings=args.listings, verbose=args.verbose) else 0)
@@ -1,34 +1,158 @@
 # THIS FILE IS TO MANUALLY REMOVE LISTINGS USING THE BLACKLIST. NORMALLY IT HAPPENS DURING API CALL
+# run with: python -m app.services.cleanup [--dry-run] [--batch-size N]
 
+import argparse
+
+from sqlalchemy import text
 
 from app import create_app, db
-from app.models import Listing
-from app.services.parse import load_blacklist, is_blacklisted
+from app.services.parse import get_blacklist
+from app.services.pipeline import PIPELINE_LOCK_KEY, bump_data_version, refresh_canonical_price_stats, refresh_deals_rollup
 
-def remove_blacklisted_listings():
-    app = create_app()
+# listings deleted per transaction
+PURGE_BATCH_SIZE = 5000
 
-    with app.app_context():
-        bl = load_blacklist()
-        listings = Listing.query.all()
 
-        to_delete = []
+def like_pattern(phrase):
+    """'%phrase%' for LIKE, with the LIKE wildcards in phrase escaped."""
+    escaped = phrase.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def count_blacklisted_listings(patterns):
+    count = db.session.execute(text(r"""
+        SELECT COUNT(*)
+        FROM listings
+        WHERE lower(title) LIKE ANY(:patterns);
+    """), {"patterns": patterns}).scalar()
+
+    examples = db.session.execute(text(r"""
+        SELECT ebay_item_id, title
+        FROM listings
+        WHERE lower(title) LIKE ANY(:patterns)
+        ORDER BY id
+        LIMIT 20;
+    """), {"patterns": patterns}).all()
+
+    return count, examples
+
+
+def delete_blacklisted_batch(patterns, after_id, batch_size):
+    """
+    Delete the next batch_size blacklisted listings with id > after_id, in one
+    transaction. models, specs, price history and the stats entries go with
+    them through ON DELETE CASCADE; model_price_stats rows of the deleted
+    models are removed first and canonical_price_stats is recomputed for the
+    keys they were in.
+    Returns (deleted, last id).
+    """
+    # same lock as the pipeline, so a purge never interleaves with a run
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:key);"), {"key": PIPELINE_LOCK_KEY})
+
+    db.session.execute(text(r"""
+        CREATE TEMP TABLE purge_ids ON COMMIT DROP AS
+        SELECT id
+        FROM listings
+        WHERE id > :after_id
+        AND lower(title) LIKE ANY(:patterns)
+        ORDER BY id
+        LIMIT :batch_size;
+    """), {"patterns": patterns, "after_id": after_id, "batch_size": batch_size})
+
+    last_id = db.session.execute(text("SELECT MAX(id) FROM purge_ids;")).scalar()
+
+    if last_id is None:
+        db.session.rollback()
+        return 0, after_id
+
+    # shaped like the pipeline's stats_changes, for refresh_canonical_price_stats
+    db.session.execute(text(r"""
+        CREATE TEMP TABLE stats_changes ON COMMIT DROP AS
+        SELECT
+            e.listing_id,
+            e.canon_model_id AS old_canon_model_id,
+            e.marketplace AS old_marketplace,
+            NULL::integer AS new_canon_model_id,
+            NULL::varchar AS new_marketplace
+        FROM price_stats_entries e
+        JOIN purge_ids p
+          ON p.id = e.listing_id;
+    """))
+
+    # model_price_stats.model_id has no cascade, and its rows are per model
+    db.session.execute(text(r"""
+        DELETE FROM model_price_stats s
+        USING models m, purge_ids p
+        WHERE s.model_id = m.id
+        AND m.listing_id = p.id;
+    """))
 
-        for listing in listings:
-            if listing.title and is_blacklisted(listing.title, bl):
-                to_delete.append(listing)
+    deleted = db.session.execute(text(r"""
+        DELETE FROM listings l
+        USING purge_ids p
+        WHERE l.id = p.id;
+    """)).rowcount
 
-        print(f"Found {len(to_delete)} blacklisted listings to delete.")
+    refresh_canonical_price_stats()
 
-        for listing in to_delete:
-            print(f"Deleting: {listing.ebay_item_id} | {listing.title}")
-            db.session.delete(listing)
+    db.session.execute(text("DROP TABLE stats_changes, purge_ids;"))
+    db.session.commit()
 
-        #for listing in to_delete: # this is for debug. remove later
-        #    print(f"WILL DELETE: {listing.ebay_item_id} | {listing.title}")
+    return deleted, last_id
 
+
+def purge_blacklisted_listings(dry_run=False, batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete every listing whose title contains a blacklisted phrase, matched in
+    PostgreSQL with lower(title) LIKE ANY, the same lowercase substring match
+    as the fetch filter (and several times faster than ILIKE ANY). Walks
+    listings by id in batches, so memory stays flat and each transaction
+    stays short. dry_run only counts.
+    """
+    patterns = [like_pattern(phrase) for phrase in get_blacklist().phrases]
+
+    if not patterns:
+        print("Blacklist is empty. Nothing to do.")
+        return 0
+
+    if dry_run:
+        count, examples = count_blacklisted_listings(patterns)
+        for ebay_item_id, title in examples:
+            print(f"WILL DELETE: {ebay_item_id} | {title}")
+        print(f"Found {count} blacklisted listings to delete (dry run, nothing deleted).")
+        return count
+
+    total = 0
+    last_id = 0
+
+    while True:
+        deleted, last_id = delete_blacklisted_batch(patterns, last_id, batch_size)
+        if not deleted:
+            break
+
+        total += deleted
+        print(f"Deleted {total} blacklisted listings so far.")
+
+    if total:
+        refresh_deals_rollup()
+        bump_data_version()
         db.session.commit()
+
+    print(f"Deleted {total} blacklisted listings.")
+    return total
+
+
+def remove_blacklisted_listings(dry_run=False, batch_size=PURGE_BATCH_SIZE):
+    app = create_app()
+
+    with app.app_context():
+        purge_blacklisted_listings(dry_run=dry_run, batch_size=batch_size)
         print("Done.")
 
+
 if __name__ == "__main__":
-    remove_blacklisted_listings()
+    arg_parser = argparse.ArgumentParser(description="Delete listings whose title matches blacklist.txt.")
+    arg_parser.add_argument("--dry-run", action="store_true", help="only count the matching listings")
+    arg_parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE, help="listings deleted per transaction")
+    args = arg_parser.parse_args()
+    remove_blacklisted_listings(dry_run=args.dry_run, batch_size=args.batch_size)
@@ -0,0 +1,245 @@
+# SHARED OAUTH TOKEN CACHE FOR EBAY API CALLERS
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from contextlib import contextmanager
+
+import httpx
+import requests
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+load_dotenv()
+
+CLIENT_ID = os.environ.get("EBAY_CLIENT_ID")
+CLIENT_SECRET = os.environ.get("EBAY_CLIENT_SECRET")
+
+TOKEN_URL = "https://api.ebay.com/identity/v1/oauth2/token"
+TOKEN_SCOPE = "https://api.ebay.com/oauth/api_scope"
+
+# refresh this many seconds before the token actually expires
+REFRESH_MARGIN = 300
+
+# "memory", "file" or "redis"
+TOKEN_BACKEND = os.environ.get("EBAY_TOKEN_CACHE", "memory")
+TOKEN_FILE = os.environ.get("EBAY_TOKEN_FILE", os.path.join(tempfile.gettempdir(), "ebay_token.json"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY = "ebay:oauth_token"
+
+
+def request_token():
+    """
+    Do the client-credentials POST.
+    Returns {"access_token": ..., "expires_at": epoch seconds}.
+    """
+    auth = b64encode(f"{CLIENT_ID}:{CLIENT_SECRET}".encode()).decode()
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Authorization": f"Basic {auth}"
+    }
+    data = {
+        "grant_type": "client_credentials",
+        "scope": TOKEN_SCOPE
+    }
+    resp = requests.post(TOKEN_URL, headers=headers, data=data, timeout=30)
+    resp.raise_for_status()
+    payload = resp.json()
+
+    return {
+        "access_token": payload["access_token"],
+        "expires_at": time.time() + int(payload.get("expires_in", 7200)),
+    }
+
+
+# -----------------------------
+# Stores shared between processes
+# -----------------------------
+class FileTokenStore:
+    """Keeps the token in a local json file, guarded by an flock on a sibling .lock file."""
+
+    def __init__(self, path=TOKEN_FILE):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, entry):
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".ebay_token.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def lock(self):
+        with open(self.lock_path, "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RedisTokenStore:
+    """Keeps the token in Redis with a TTL matching its expiry."""
+
+    def __init__(self, url=REDIS_URL, key=REDIS_KEY):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def load(self):
+        raw = self.client.get(self.key)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def save(self, entry):
+        ttl = max(int(entry["expires_at"] - time.time()), 1)
+        self.client.set(self.key, json.dumps(entry), ex=ttl)
+
+    @contextmanager
+    def lock(self):
+        with self.client.lock(f"{self.key}:lock", timeout=60, blocking_timeout=60):
+            yield
+
+
+# -----------------------------
+# Token cache
+# -----------------------------
+class TokenCache:
+    """
+    Caches the access token until shortly before it expires.
+
+    Refreshes are single-flight: a threading lock covers threads and coroutines
+    in this process, and the store lock (file or Redis) covers other workers.
+    """
+
+    def __init__(self, fetch_token=request_token, store=None, margin=REFRESH_MARGIN):
+        self.fetch_token = fetch_token
+        self.store = store
+        self.margin = margin
+        self._entry = None
+        self._rejected = None
+        self._lock = threading.Lock()
+
+    def _valid(self, entry):
+        if (
+            entry
+            and entry.get("access_token") != self._rejected
+            and entry.get("expires_at", 0) - self.margin > time.time()
+        ):
+            return entry["access_token"]
+        return None
+
+    def get(self):
+        token = self._valid(self._entry)
+        if token:
+            return token
+
+        with self._lock:
+            # another thread may have refreshed while we waited
+            token = self._valid(self._entry)
+            if token:
+                return token
+
+            if self.store is None:
+                self._entry = self.fetch_token()
+                return self._entry["access_token"]
+
+            entry = self.store.load()
+            if not self._valid(entry):
+                with self.store.lock():
+                    # another process may have refreshed while we waited
+                    entry = self.store.load()
+                    if not self._valid(entry):
+                        entry = self.fetch_token()
+                        self.store.save(entry)
+
+            self._entry = entry
+            return entry["access_token"]
+
+    async def get_async(self):
+        token = self._valid(self._entry)
+        if token:
+            return token
+
+        # refresh in a worker thread so the event loop keeps running
+        return await asyncio.to_thread(self.get)
+
+    def invalidate(self, token=None):
+        """
+        Drop the cached token, e.g. after a 401. Given the rejected token, it is
+        also ignored in the shared store, and callers that got a 401 for an
+        already replaced token don't refresh again.
+        """
+        with self._lock:
+            if token is None and self._entry:
+                token = self._entry["access_token"]
+            self._rejected = token
+            if self._entry and self._entry["access_token"] == token:
+                self._entry = None
+
+
+class BearerAuth(httpx.Auth):
+    """
+    httpx auth that reads the token from the cache on every request. On a 401
+    the token is invalidated and the request sent once more with a new one,
+    so a run that outlives a token keeps going.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def sync_auth_flow(self, request):
+        token = self.cache.get()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+
+        if response.status_code == 401:
+            self.cache.invalidate(token)
+            request.headers["Authorization"] = f"Bearer {self.cache.get()}"
+            yield request
+
+    async def async_auth_flow(self, request):
+        token = await self.cache.get_async()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+
+        if response.status_code == 401:
+            self.cache.invalidate(token)
+            request.headers["Authorization"] = f"Bearer {await self.cache.get_async()}"
+            yield request
+
+
+def build_token_cache(backend=TOKEN_BACKEND):
+    if backend == "file":
+        return TokenCache(store=FileTokenStore())
+    if backend == "redis":
+        return TokenCache(store=RedisTokenStore())
+    return TokenCache()
+
+
+token_cache = build_token_cache()
+bearer_auth = BearerAuth(token_cache)
@@ -0,0 +1,261 @@
+# STATIC SNAPSHOT OF THE PUBLIC PAGES
+# run with: python -m app.services.export_static [--out DIR] [--pages N] [--workers N]
+# main_fetch.py runs it after a successful pipeline run when STATIC_EXPORT_DIR is set.
+#
+# Renders every country, model, deals, best-deals, price-drops and thinkpad_models
+# page (the first N pages of each sort) through the app, into
+#
+#   DIR/snapshots/<data_version>-<timestamp>/<path>/index.html
+#   DIR/snapshots/<data_version>-<timestamp>/<path>/index.<query>.html
+#
+# with .gz (and .br, if the brotli package is installed) siblings. The DIR/current
+# symlink is switched to the new snapshot with one os.replace once every page is
+# written, so readers never see a half written export. nginx serves it with e.g.
+#
+#   map $args $export_args { "" ""; default ".$args"; }
+#   location / {
+#       root DIR/current;
+#       gzip_static on;
+#       try_files $uri/index$export_args.html @app;
+#   }
+#
+# Anything not in the snapshot (deeper pages, filters) falls through to the app.
+# Runs for different marketplaces may overlap; exports into the same DIR take
+# turns on an flock of DIR/.export.lock, so one never prunes another's snapshot.
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from html import unescape
+from urllib.parse import urlsplit
+
+from flask import url_for
+from sqlalchemy import text
+
+from app import create_app, db
+from app.page_cache import SKIP_PAGE_CACHE
+from app.route_helpers import get_enabled_markets
+
+try:
+    import brotli
+except ImportError:  # optional, only .gz siblings without it
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+# sort values of each exported view, as the sort links in the templates use them
+SORTS = {
+    "main.country_home": ["price", "model", "cpu", "ram", "storage"],
+    "main.model_page": ["price", "cpu", "ram", "storage"],
+    "main.deals": ["cheapest_price", "model_name", "listing_count"],
+    "main.best_deals": ["discount", "model", "price", "avg_price"],
+    "main.price_drops": ["lowest_price", "model_name", "old_price", "new_price"],
+    "main.thinkpad_models": [],
+}
+
+# snapshots kept besides the current one, for readers still on the previous
+KEEP_SNAPSHOTS = 1
+
+# the Next link rendered by render_pagination
+NEXT_LINK = re.compile(r'class="page-link next-link"\s+href="([^"]+)"')
+
+
+def snapshot_file(path, query=""):
+    """Relative file for a path and raw query string, see the nginx config above."""
+    name = f"index.{query}.html" if query else "index.html"
+    return os.path.join(path.strip("/"), name)
+
+
+def write_page(root, path, query, body):
+    """The page and its compressed siblings, if they are smaller."""
+    target = os.path.join(root, snapshot_file(path, query))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    with open(target, "wb") as f:
+        f.write(body)
+
+    compressed = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed[".br"] = brotli.compress(body, quality=11)
+
+    for suffix, data in compressed.items():
+        if len(data) < len(body):
+            with open(target + suffix, "wb") as f:
+                f.write(data)
+
+
+def start_urls():
+    """Page 1 of every exported view and sort, as relative URLs. Needs a request context."""
+    models = db.session.execute(text(r"""
+        SELECT c.marketplace, ml.slug
+        FROM canonical_price_stats c
+        JOIN model_list ml
+          ON ml.id = c.canon_model_id
+        WHERE c.listing_count > 0
+        ORDER BY c.marketplace, ml.slug;
+    """)).all()
+
+    slugs_by_marketplace = {}
+    for marketplace, slug in models:
+        slugs_by_marketplace.setdefault(marketplace, []).append(slug)
+
+    urls = []
+    for country, marketplace in get_enabled_markets().items():
+        views = [(endpoint, {"country": country}) for endpoint in SORTS if endpoint != "main.model_page"]
+        views += [("main.model_page", {"country": country, "model_slug": slug}) for slug in slugs_by_marketplace.get(marketplace, [])]
+
+        for endpoint, values in views:
+            path = url_for(endpoint, **values)
+            urls.append(path)
+            for sort in SORTS[endpoint]:
+                for direction in ("asc", "desc"):
+                    urls.append(f"{path}?sort={sort}&direction={direction}")
+
+    return urls
+
+
+def render(app, base_url, url):
+    """
+    (status, body, next page URL or None) of a relative URL. The page cache is
+    skipped: rendered pages go to disk, keeping them in memory too is waste.
+    """
+    response = app.test_client().get(url, base_url=base_url, environ_base={SKIP_PAGE_CACHE: True})
+    body = response.get_data()
+
+    next_url = None
+    if response.status_code == 200:
+        next_link = NEXT_LINK.search(body.decode("utf-8", "replace"))
+        if next_link:
+            next_url = unescape(next_link.group(1))
+
+    return response.status_code, body, next_url
+
+
+@contextmanager
+def export_lock(out_dir):
+    """Exclusive lock on out_dir, held for a whole export."""
+    with open(os.path.join(out_dir, ".export.lock"), "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def switch_current(out_dir, snapshot):
+    """Point out_dir/current at snapshot in one rename, then drop old snapshots."""
+    current = os.path.join(out_dir, "current")
+    link = os.path.join(out_dir, f".current-{os.getpid()}")
+
+    os.symlink(os.path.join("snapshots", snapshot), link)
+    os.replace(link, current)
+
+    snapshots_dir = os.path.join(out_dir, "snapshots")
+    old = sorted(
+        (name for name in os.listdir(snapshots_dir) if name != snapshot),
+        key=lambda name: os.path.getmtime(os.path.join(snapshots_dir, name)),
+    )
+    for name in old[:max(len(old) - KEEP_SNAPSHOTS, 0)]:
+        shutil.rmtree(os.path.join(snapshots_dir, name), ignore_errors=True)
+
+
+def export_static_pages(app, out_dir, base_url, pages=1, workers=4):
+    """
+    Render the first `pages` pages of every view and sort into a new snapshot of
+    out_dir and make it current. Pages are rendered by a thread pool, each
+    request on its own app context and database connection. base_url is the
+    public site URL, which the canonical links are built from.
+    Returns the number of pages written.
+    """
+    if not base_url:
+        raise ValueError("a base_url is needed for the canonical links of the exported pages")
+
+    os.makedirs(out_dir, exist_ok=True)
+    with export_lock(out_dir):
+        return export_snapshot(app, out_dir, base_url, pages, workers)
+
+
+def export_snapshot(app, out_dir, base_url, pages, workers):
+    """One export, run with the export lock held."""
+    start = time.perf_counter()
+
+    with app.test_request_context(base_url=base_url):
+        version = db.session.execute(text("SELECT version FROM data_version WHERE id = 1;")).scalar() or 0
+        urls = start_urls()
+
+    snapshot = f"{version}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    root = os.path.join(out_dir, "snapshots", snapshot)
+    os.makedirs(root)
+
+    written = 0
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # future -> (url, page number); page n + 1 is queued once page n is rendered
+        pending = {pool.submit(render, app, base_url, url): (url, 1) for url in urls}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                url, page = pending.pop(future)
+                status, body, next_url = future.result()
+
+                if status != 200:
+                    failed += 1
+                    print(f"Skipped {url}: {status}")
+                    continue
+
+                parts = urlsplit(url)
+                write_page(root, parts.path, parts.query, body)
+                written += 1
+
+                if next_url and page < pages:
+                    pending[pool.submit(render, app, base_url, next_url)] = (next_url, page + 1)
+
+    if not written:
+        shutil.rmtree(root, ignore_errors=True)
+        print("Nothing exported, current snapshot left in place.")
+        return 0
+
+    switch_current(out_dir, snapshot)
+
+    print(f"Exported {written} pages to {root} in {time.perf_counter() - start:.1f} s ({failed} skipped).")
+    return written
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Render the public pages into a static snapshot.")
+    arg_parser.add_argument("--out", help="export directory (default: STATIC_EXPORT_DIR)")
+    arg_parser.add_argument("--pages", type=int, help="pages per view and sort (default: STATIC_EXPORT_PAGES)")
+    arg_parser.add_argument("--workers", type=int, help="render threads (default: STATIC_EXPORT_WORKERS)")
+    arg_parser.add_argument("--base-url", help="public site URL, for canonical links (default: STATIC_EXPORT_BASE_URL)")
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    out_dir = args.out or app.config["STATIC_EXPORT_DIR"]
+    if not out_dir:
+        arg_parser.error("no --out given and STATIC_EXPORT_DIR is not set")
+
+    base_url = args.base_url or app.config["STATIC_EXPORT_BASE_URL"]
+    if not base_url:
+        arg_parser.error("no --base-url given and STATIC_EXPORT_BASE_URL is not set")
+
+    export_static_pages(
+        app,
+        out_dir,
+        base_url,
+        pages=args.pages or app.config["STATIC_EXPORT_PAGES"],
+        workers=args.workers or app.config["STATIC_EXPORT_WORKERS"],
+    )
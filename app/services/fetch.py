@@ -1,140 +1,288 @@
 from app import create_app, db
-import requests
-from base64 import b64encode
+from app.services.ebay_auth import bearer_auth, token_cache
+from app.services.rate_limit import rate_controller, request_with_retry
 import os
 from dotenv import load_dotenv
 from sqlalchemy import text
 import asyncio
 import httpx
-import time
-import random
+import queue
+import threading
 
 
 load_dotenv()
 app = create_app()
 
-CLIENT_ID = os.environ.get("EBAY_CLIENT_ID")
-CLIENT_SECRET = os.environ.get("EBAY_CLIENT_SECRET")
 CAMPAIGN_ID = os.environ.get("CAMPAIGN_ID")
 CATEGORY_ID = "177"
 
 
 def get_token():
-    """Get OAuth token from eBay."""
-    auth = b64encode(f"{CLIENT_ID}:{CLIENT_SECRET}".encode()).decode()
-    url = "https://api.ebay.com/identity/v1/oauth2/token"
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Authorization": f"Basic {auth}"
-    }
-    data = {
-        "grant_type": "client_credentials",
-        "scope": "https://api.ebay.com/oauth/api_scope"
-    }
-    resp = requests.post(url, headers=headers, data=data)
-    resp.raise_for_status()
-    return resp.json()["access_token"]
+    """Get OAuth token from eBay (cached until shortly before it expires)."""
+    return token_cache.get()
 
 
-def get_paginated_summaries(query="thinkpad", limit=200, maximum_items=200):
-    """Fetch item summaries with pagination across marketplaces."""
-
-    token = get_token()
-    
-    marketplaces = {
-        "EBAY_US": "US", 
-        "EBAY_GB": "GB", 
-        "EBAY_DE": "DE", 
-        "EBAY_AU": "AU"
-    }
+MARKETPLACES = {
+    "EBAY_US": "US",
+    "EBAY_GB": "GB",
+    "EBAY_DE": "DE",
+    "EBAY_AU": "AU"
+}
 
-    all_items = []
+SUMMARY_URL = "https://api.ebay.com/buy/browse/v1/item_summary/search"
 
-    for market, country_code in marketplaces.items():
+# pages in flight per marketplace
+MARKET_CONCURRENCY = 4
 
-        offset = 0
-        market_items = []
 
-        while len(market_items) < maximum_items:
+def summary_headers(market):
+    return {
+        "X-EBAY-C-MARKETPLACE-ID": market,
+        "X-EBAY-C-ENDUSERCTX": f"affiliateCampaignId={CAMPAIGN_ID}"
+    }
 
-            url = "https://api.ebay.com/buy/browse/v1/item_summary/search"
 
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "X-EBAY-C-MARKETPLACE-ID": market,
-                "X-EBAY-C-ENDUSERCTX": f"affiliateCampaignId={CAMPAIGN_ID}"
-            }
+def summary_params(query, country_code, limit, offset):
+    return {
+        "q": query,
+        "category_ids": CATEGORY_ID,
+        "limit": limit,
+        "offset": offset,
+        "fieldgroups": "EXTENDED",
+        "sort": "newlyListed",
+        "filter": f"conditionIds:{{1000|1500|2000|2500|3000}},"
+                f"buyingOptions:{{FIXED_PRICE}},"
+                f"itemLocationCountry:{country_code}"
+    }
 
-            params = {
-                "q": query,
-                "category_ids": CATEGORY_ID,
-                "limit": limit,
-                "offset": offset,
-                "fieldgroups": "EXTENDED",
-                "sort": "newlyListed",
-                "filter": f"conditionIds:{{1000|1500|2000|2500|3000}},"
-                        f"buyingOptions:{{FIXED_PRICE}},"
-                        f"itemLocationCountry:{country_code}"
-            }
 
-            try:
-                print(f"{market}: page {offset // limit + 1}")
-                resp = requests.get(url, headers=headers, params=params)
-                resp.raise_for_status()
+def filter_market_items(items, market, country_code):
+    """Keep items located in the marketplace country and tag them with the marketplace."""
+    filtered_items = []
 
-                items = resp.json().get("itemSummaries", [])
+    for item in items:
+        item_country = item.get("itemLocation", {}).get("country")
 
-                if not items:
-                    break
+        if item_country != country_code:
+            continue
 
-                filtered_items = []
+        item["marketplace_id"] = market
+        item["marketplace_country"] = market.split("_", 1)[1]
+        filtered_items.append(item)
 
-                for item in items:
-                    item_country = item.get("itemLocation", {}).get("country")
+    return filtered_items
 
-                    if item_country != country_code:
-                        continue
 
-                    item["marketplace_id"] = market
-                    item["marketplace_country"] = market.split("_", 1)[1]
-                    filtered_items.append(item)
+async def fetch_summary_page(client, controller, market, country_code, query, limit, offset, sem):
+    """
+    Fetch one page of summaries, retrying 429/5xx through the rate controller.
+    Returns the raw itemSummaries list, or None if the request failed.
+    """
+    async with sem:
+        page = offset // limit + 1
+        print(f"{market}: page {page}")
+
+        try:
+            r = await request_with_retry(
+                client,
+                controller,
+                "GET",
+                SUMMARY_URL,
+                label=f"{market} page {page}",
+                headers=summary_headers(market),
+                params=summary_params(query, country_code, limit, offset),
+                timeout=30
+            )
+            return r.json().get("itemSummaries", [])
+
+        except httpx.HTTPError as e:
+            print(f"Failed fetching {market} page {offset // limit + 1}: {e}")
+            return None
+
+
+async def iter_market_pages(client, controller, market, country_code, query, limit, maximum_items, concurrency):
+    """
+    Page through one marketplace, yielding filtered pages in offset order.
+
+    Offsets are requested in waves of `concurrency` pages so the next pages are
+    already in flight while the current one is being processed. Paging stops at
+    the first empty, failed or short page.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    fetched = 0
+    offset = 0
+
+    while fetched < maximum_items:
+        pages_needed = -(-(maximum_items - fetched) // limit)
+        wave = [offset + i * limit for i in range(min(concurrency, pages_needed))]
+        offset += len(wave) * limit
+
+        pages = await asyncio.gather(*(
+            fetch_summary_page(client, controller, market, country_code, query, limit, page_offset, sem)
+            for page_offset in wave
+        ))
+
+        for items in pages:
+            if not items:
+                return
+
+            filtered_items = filter_market_items(items, market, country_code)
+            remaining = maximum_items - fetched
+            page_items = filtered_items[:remaining]
+            fetched += len(page_items)
+
+            yield page_items
+
+            # stop if last page or enough items
+            if len(items) < limit or fetched >= maximum_items:
+                return
+
+
+async def stream_summary_pages(query="thinkpad", limit=200, maximum_items=200, concurrency=MARKET_CONCURRENCY, controller=None, markets=None):
+    """
+    Async generator over filtered summary pages from every marketplace in
+    markets (default: all of MARKETPLACES).
+    Marketplaces are paged concurrently and pages are yielded as they arrive.
+    """
+
+    controller = controller or rate_controller
+    markets = {market: MARKETPLACES[market] for market in (markets or MARKETPLACES)}
+
+    pool = httpx.Limits(
+        max_connections=concurrency * len(markets),
+        max_keepalive_connections=concurrency * len(markets)
+    )
+
+    pages = asyncio.Queue(maxsize=concurrency * len(markets))
+    done = object()
+    errors = []
+
+    async def pump(client, market, country_code):
+        fetched = 0
+        try:
+            async for page_items in iter_market_pages(
+                client, controller, market, country_code, query, limit, maximum_items, concurrency
+            ):
+                fetched += len(page_items)
+                await pages.put(page_items)
+        except Exception as e:
+            errors.append(e)
+
+        print(f"{market}: fetched {fetched} items")
+        await pages.put(done)
+
+    # the token is read per request, and refreshed once on a 401
+    async with httpx.AsyncClient(limits=pool, auth=bearer_auth) as client:
+        tasks = [
+            asyncio.create_task(pump(client, market, country_code))
+            for market, country_code in markets.items()
+        ]
 
-                remaining = maximum_items - len(market_items)
-                market_items.extend(filtered_items[:remaining])
+        try:
+            remaining = len(tasks)
+            while remaining:
+                page_items = await pages.get()
+                if page_items is done:
+                    remaining -= 1
+                    continue
+                yield page_items
+
+            # surface unexpected errors from the pumps
+            if errors:
+                raise errors[0]
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"Summary requests: {controller.stats()}")
+
+
+def iter_summary_pages(query="thinkpad", limit=200, maximum_items=200, max_buffered_pages=8, markets=None):
+    """
+    Yield summary pages as they arrive.
+
+    The async fetcher runs in a background thread, so network waits overlap
+    with whatever the caller does with each page (e.g. writing to the db).
+    The bounded queue holds at most max_buffered_pages, which keeps memory
+    flat however large maximum_items gets.
+    """
+    pages = queue.Queue(maxsize=max_buffered_pages)
+    stop = threading.Event()
+    done = object()
+    errors = []
+
+    def put(page_items):
+        while not stop.is_set():
+            try:
+                pages.put(page_items, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def produce():
+        async for page_items in stream_summary_pages(query, limit, maximum_items, markets=markets):
+            if not await asyncio.to_thread(put, page_items):
+                break
 
-                offset += limit
+    def worker():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target=worker, name="summary-fetch", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            page_items = pages.get()
+            if page_items is done:
+                break
+            yield page_items
+    finally:
+        stop.set()
+        thread.join()
 
-                # stop if last page
-                if len(items) < limit:
-                    break
+    if errors:
+        raise errors[0]
 
-                time.sleep(0.2)
 
-            except requests.RequestException as e:
-                print(f"Failed fetching {market} page {offset // limit + 1}: {e}")
-                break
+async def get_paginated_summaries_async(query="thinkpad", limit=200, maximum_items=200, concurrency=MARKET_CONCURRENCY, controller=None):
+    """Fetch item summaries from all marketplaces concurrently over one pooled client."""
 
-        print(f"{market}: fetched {len(market_items)} items")
+    all_items = []
 
-        all_items.extend(market_items)
+    async for page_items in stream_summary_pages(query, limit, maximum_items, concurrency, controller):
+        all_items.extend(page_items)
 
     unique = {item["itemId"]: item for item in all_items}
     return list(unique.values())
 
 
+def get_paginated_summaries(query="thinkpad", limit=200, maximum_items=200):
+    """Fetch item summaries with pagination across marketplaces."""
+    return asyncio.run(get_paginated_summaries_async(query, limit, maximum_items))
+
+
 
-# check temp_summaries against listings to fetch only items not already there
-def new_listings():
+# check a batch in temp_summaries against listings to fetch only items not already there
+def new_listings(batch_id):
         return db.session.execute(text("""
         SELECT ts.*
         FROM temp_summaries ts
         LEFT JOIN listings l
             ON l.ebay_item_id = ts.ebay_item_id
-        WHERE l.id IS NULL
-    """)).mappings().all()
+        WHERE ts.batch_id = :batch_id
+        AND l.id IS NULL
+    """), {"batch_id": batch_id}).mappings().all()
 
 
-async def fetch_one(client, listing, token, sem):
+async def fetch_one(client, controller, listing):
 
     item_id = listing["ebay_item_id"]
     marketplace = listing["marketplace"]
@@ -142,54 +290,38 @@ async def fetch_one(client, listing, token, sem):
     url = f"https://api.ebay.com/buy/browse/v1/item/{item_id}"
 
     headers = {
-        "Authorization": f"Bearer {token}",
         "X-EBAY-C-MARKETPLACE-ID": marketplace,
         "X-EBAY-C-ENDUSERCTX": f"affiliateCampaignId={CAMPAIGN_ID}"
 
     }
 
-    async with sem:
-
-        for attempt in range(5):
-
-            try:
-                r = await client.get(url, headers=headers, timeout=30)
-                r.raise_for_status()
-                return r.json()
-
-            except httpx.HTTPStatusError as e:
+    try:
+        r = await request_with_retry(client, controller, "GET", url, label=item_id, headers=headers, timeout=30)
+        return r.json()
 
-                status = e.response.status_code
-
-                if status == 429 or 500 <= status < 600:
-
-                    wait = 2 ** attempt + random.random()
-                    print(f"{item_id} retry {attempt} in {wait:.1f}s")
-
-                    await asyncio.sleep(wait)
-
-                else:
-                    print(f"{item_id} failed: {status}")
-                    return None
+    except httpx.HTTPStatusError as e:
+        print(f"{item_id} failed: {e.response.status_code}")
+        return None
 
+    except httpx.HTTPError as e:
+        print(f"{item_id} failed: {e}")
         return None
     
 
-async def fetch_item_details_async(listings):
+async def fetch_item_details_async(listings, controller=None):
 
-    token = get_token()
+    # shared limiter instead of a fixed semaphore
+    controller = controller or rate_controller
 
-    sem = asyncio.Semaphore(8)  # concurrency limit
-
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(auth=bearer_auth) as client:
 
         tasks = [
-            fetch_one(client, listing, token, sem)
+            fetch_one(client, controller, listing)
             for listing in listings
         ]
 
         results = await asyncio.gather(*tasks)
 
-    return [r for r in results if r]
-
+    print(f"Detail requests: {controller.stats()}")
 
+    return [r for r in results if r]
@@ -2,10 +2,13 @@
 import os
 import sys
 from app import create_app
-from app.services.save_temp import save_temp_summaries
-from app.services.pipeline import run_pipeline, truncate_temp_tables
-from app.services.fetch import get_paginated_summaries
-from app.services.parse import blacklist
+from app.config import Config
+from app.services.save_temp import save_temp_summaries_stream
+from app.services.pipeline import run_pipeline
+from app.services.batches import open_batch, close_batch, drop_old_batches
+from app.services.export_static import export_static_pages
+from app.services.fetch import iter_summary_pages, MARKETPLACES
+from app.services.parse import blacklist_pages
 from datetime import datetime
 import traceback
 import tempfile
@@ -13,10 +16,14 @@ import tempfile
 # -----------------------------
 # CONFIG
 # -----------------------------
+# usage: main_fetch.py [EBAY_US EBAY_DE ...]   (default: every marketplace)
+# runs for different marketplaces load their own batch and may overlap
+MARKETS = sorted(sys.argv[1:] or MARKETPLACES)
+
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 LOG_DIR = os.path.join(PROJECT_ROOT, "logs")
 LOG_FILE = os.path.join(LOG_DIR, "main_fetch.log")
-LOCK_FILE = os.path.join(tempfile.gettempdir(), "main_fetch.lock")
+LOCK_FILE = os.path.join(tempfile.gettempdir(), f"main_fetch-{'-'.join(MARKETS)}.lock")
 
 
 # Ensure logs directory exists
@@ -26,8 +33,17 @@ os.makedirs(LOG_DIR, exist_ok=True)
 # -----------------------------
 # Prevent overlapping runs
 # -----------------------------
+unknown = [market for market in MARKETS if market not in MARKETPLACES]
+if unknown:
+    print(f"Unknown marketplaces: {', '.join(unknown)}. Exiting.")
+    sys.exit(1)
+
+if Config.STATIC_EXPORT_DIR and not Config.STATIC_EXPORT_BASE_URL:
+    print("STATIC_EXPORT_DIR is set but STATIC_EXPORT_BASE_URL is not; the export needs it for canonical links. Exiting.")
+    sys.exit(1)
+
 if os.path.exists(LOCK_FILE):
-    print("Another main_fetch.py job is already running. Exiting.")
+    print(f"Another main_fetch.py job for {', '.join(MARKETS)} is already running. Exiting.")
     sys.exit(0)
 
 # Create lock file
@@ -38,20 +54,33 @@ with open(LOCK_FILE, "w") as f:
 # Main job
 # -----------------------------
 def main():
-    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Starting main_fetch.py job")
+    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Starting main_fetch.py job for {', '.join(MARKETS)}")
     app = create_app()
     try:
         with app.app_context():
-            # truncate old data
-            truncate_temp_tables()
-            # Fetch summaries
-            items = get_paginated_summaries()
-            clean_items = blacklist(items)
-            save_temp_summaries(clean_items)
-            print(f"Fetched and saved {len(items)} summaries")
+            # new staging batch for this run
+            batch_id = open_batch(MARKETS)
+            # Fetch summaries, streaming pages into the db as they arrive
+            pages = blacklist_pages(iter_summary_pages(markets=MARKETS))
+            saved = save_temp_summaries_stream(pages, batch_id)
+            print(f"Fetched and saved {saved} summaries")
+            close_batch(batch_id)
 
             # Run pipeline and parsing
-            run_pipeline()
+            processed = run_pipeline(batch_id)
+
+            # processed and abandoned batches, with their staging rows
+            drop_old_batches()
+
+        # pre-render the public pages once the new data is committed
+        if processed and app.config["STATIC_EXPORT_DIR"]:
+            export_static_pages(
+                app,
+                app.config["STATIC_EXPORT_DIR"],
+                app.config["STATIC_EXPORT_BASE_URL"],
+                pages=app.config["STATIC_EXPORT_PAGES"],
+                workers=app.config["STATIC_EXPORT_WORKERS"],
+            )
 
     except Exception:
         print("Error occurred in main_fetch.py:")
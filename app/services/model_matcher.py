@@ -0,0 +1,49 @@
+# COMPILED CANONICAL MODEL MATCHER FOR TITLE PARSING
+
+from app.services.aho_corasick import Automaton
+
+
+def is_word_char(ch):
+    # same characters as \w in a str pattern
+    return ch.isalnum() or ch == "_"
+
+
+def is_boundary(text, pos):
+    """True where \\b would match at pos."""
+    before = pos > 0 and is_word_char(text[pos - 1])
+    after = pos < len(text) and is_word_char(text[pos])
+    return before != after
+
+
+class ModelMatcher:
+    """
+    Finds the canonical model in a piece of (lowercased) text.
+
+    Same result as trying re.search(rf"\\b{re.escape(name.lower())}\\b", text)
+    for every name from longest to shortest and taking the first hit, but all
+    names are matched in a single pass.
+    """
+
+    def __init__(self, known_models):
+        """known_models = {canonical name: ThinkPadModel.id}"""
+        sorted_models = sorted(known_models, key=len, reverse=True)
+
+        self.automaton = Automaton()
+        for rank, name in enumerate(sorted_models):
+            self.automaton.add(name.lower(), (rank, name, known_models[name]))
+        self.automaton.build()
+
+    def match(self, text):
+        """Return (name, canon_id) of the longest match, or (None, None)."""
+        best = None
+
+        for start, end, value in self.automaton.iter_matches(text):
+            if best is not None and value[0] >= best[0]:
+                continue
+            if is_boundary(text, start) and is_boundary(text, end):
+                best = value
+
+        if best is None:
+            return None, None
+
+        return best[1], best[2]
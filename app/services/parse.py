@@ -1,7 +1,7 @@
 import re
 import os
-import logging
 from app.models import db, Specs, Model, ThinkPadModel, Listing
+from app.services.blacklist_matcher import BlacklistFile, BlacklistMatcher
 
 
 STORAGE_MAP = {
@@ -240,39 +240,43 @@ def parse_all_models():
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BLACKLIST_PATH = os.path.join(BASE_DIR, "blacklist.txt")
 
+# compiled once, recompiled when blacklist.txt changes
+blacklist_file = BlacklistFile(BLACKLIST_PATH)
+
+
+def get_blacklist():
+    """The compiled BlacklistMatcher for blacklist.txt."""
+    return blacklist_file.get()
+
 # Load blacklist from a file
 def load_blacklist():
     """
-    Load blacklist keywords/phrases from a file.
-    - One entry per line
-    - Lines starting with '#' are ignored as comments
-    - Case-insensitive (converted to lowercase)
+    Blacklist keywords/phrases from blacklist.txt, lowercased.
+    Only re-read from disk when the file has changed.
     """
-    blacklist = []
-    try:
-        with open(BLACKLIST_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue  # skip empty lines or comments
-                blacklist.append(line.lower())
-    except FileNotFoundError:
-        logging.warning(f"Warning: Blacklist file '{BLACKLIST_PATH}' not found. Continuing without blacklist.")
-    return blacklist
+    return list(get_blacklist().phrases)
 
 # Check if a listing title contains any blacklisted word
-def is_blacklisted(title, blacklist):
+def is_blacklisted(title, blacklist=None):
+    """
+    blacklist can be a BlacklistMatcher, a list of lowercase phrases, or None
+    for the cached blacklist.txt matcher.
+    """
+    if blacklist is None:
+        blacklist = get_blacklist()
+    if isinstance(blacklist, BlacklistMatcher):
+        return blacklist.is_blacklisted(title)
+
     title_lower = title.lower()
     return any(word in title_lower for word in blacklist)
 
 def blacklist(listings):
-    bl = load_blacklist()   
-    clean_items = []
+    return list(get_blacklist().filter_items(listings))
 
-    for listing in listings:
-        if is_blacklisted(listing["title"], bl):
-            # Skip blacklisted item
-            continue
-        clean_items.append(listing)
-    
-    return clean_items
\ No newline at end of file
+
+def blacklist_pages(pages):
+    """Drop blacklisted items from every page of a page stream, with one matcher for the whole stream."""
+    matcher = get_blacklist()
+
+    for page in pages:
+        yield list(matcher.filter_items(page))
@@ -1,8 +1,10 @@
 from app.extensions import db
 from sqlalchemy import text
 from app.services.title_parse import process_title
+from app.services.price_history import ensure_price_history_partitions
+from app.services.batches import mark_batch_processed
     
-def insert_models(): # turn this off
+def insert_models(batch_id): # turn this off
     db.session.execute(text(r"""
         INSERT INTO models (listing_id, raw_model, raw_mpn)
         SELECT
@@ -12,15 +14,16 @@ def insert_models(): # turn this off
         FROM listings l
         JOIN temp_details td
           ON td.ebay_item_id = l.ebay_item_id
+         AND td.batch_id = :batch_id
         WHERE NOT EXISTS (
             SELECT 1
             FROM models m
             WHERE m.listing_id = l.id
         );
-    """))
+    """), {"batch_id": batch_id})
 
 # add detailed specs from temp to main table.
-def insert_specs(): # turn this off
+def insert_specs(batch_id): # turn this off
     """
     Insert specs from temp details
     """
@@ -57,7 +60,8 @@ def insert_specs(): # turn this off
         FROM temp_details td
         JOIN listings l
         ON l.ebay_item_id = td.ebay_item_id
-        WHERE l.category_id = '177'
+        WHERE td.batch_id = :batch_id
+        AND l.category_id = '177'
         ON CONFLICT (listing_id) 
         DO UPDATE SET
         ram = COALESCE(EXCLUDED.ram, specs.ram),
@@ -67,10 +71,10 @@ def insert_specs(): # turn this off
         raw_ram = EXCLUDED.raw_ram,
         raw_storage = EXCLUDED.raw_storage,
         raw_storage_type = EXCLUDED.raw_storage_type;
-    """))
+    """), {"batch_id": batch_id})
 
 # add summaries from temp tabel into main listings table
-def insert_listings():
+def insert_listings(batch_id):
     """
     Insert listings joined with temp details and models.
     """
@@ -113,115 +117,521 @@ def insert_listings():
             NULL,
             0
         FROM temp_summaries ts
-        WHERE ts.category_id = '177'
+        WHERE ts.batch_id = :batch_id
+        AND ts.category_id = '177'
         ON CONFLICT (ebay_item_id) DO NOTHING;
+    """), {"batch_id": batch_id})
+
+# the listing lifecycle steps in one statement
+def update_listing_lifecycle(batch_id):
+    """
+    Same result as the five separate steps in app/services/bench_lifecycle.py
+    (update_listing_prices, mark_sold_listings, update_seen_listings,
+    increment_miss_count and mark_ended_listings) run in that order, in a
+    single UPDATE.
+
+    The changes are computed from one join of the batch with its listings and
+    one anti-join of the ACTIVE set, and every listing row is written at most
+    once instead of up to three times. Listings that end take their
+    listing_price_changes row with them out of the price-drops indexes.
+    """
+    result = db.session.execute(text(r"""
+        WITH changes AS (
+            -- listings in the batch: price updates, sold, seen
+            SELECT
+                l.id,
+                TRUE AS seen,
+                ts.price AS ts_price,
+                ts.sold_at,
+                ts.sold_at IS NOT NULL AND l.status <> 'ENDED' AS sold
+            FROM listings l
+            JOIN temp_summaries ts
+              ON ts.ebay_item_id = l.ebay_item_id
+             AND ts.batch_id = :batch_id
+            WHERE l.status = 'ACTIVE'
+            OR (ts.sold_at IS NOT NULL AND l.status <> 'ENDED')
+
+            UNION ALL
+
+            -- ACTIVE listings of the batch's marketplaces missing from it: miss count, ended
+            SELECT
+                l.id,
+                FALSE,
+                NULL,
+                NULL,
+                FALSE
+            FROM listings l
+            JOIN fetch_batches b
+              ON b.id = :batch_id
+            WHERE l.status = 'ACTIVE'
+            AND l.marketplace = ANY(b.marketplaces)
+            AND NOT EXISTS (
+                SELECT 1
+                FROM temp_summaries ts
+                WHERE ts.batch_id = :batch_id
+                AND ts.ebay_item_id = l.ebay_item_id
+            )
+        ),
+        updated AS (
+            UPDATE listings l
+            SET
+                price = CASE
+                    WHEN c.seen AND l.status = 'ACTIVE' AND l.price <> c.ts_price THEN c.ts_price
+                    ELSE l.price
+                END,
+                status = CASE
+                    WHEN c.sold THEN 'ENDED'
+                    WHEN NOT c.seen AND l.miss_count + 1 >= 3 THEN 'ENDED'
+                    ELSE l.status
+                END,
+                ended_at = CASE
+                    WHEN c.sold THEN c.sold_at
+                    WHEN NOT c.seen AND l.miss_count + 1 >= 3 THEN NOW()
+                    ELSE l.ended_at
+                END,
+                last_seen = CASE
+                    WHEN c.seen AND NOT c.sold THEN NOW()
+                    ELSE l.last_seen
+                END,
+                miss_count = CASE
+                    WHEN c.seen AND NOT c.sold THEN 0
+                    WHEN NOT c.seen THEN l.miss_count + 1
+                    ELSE l.miss_count
+                END,
+                last_updated = NOW()
+            FROM changes c
+            WHERE l.id = c.id
+            RETURNING l.id, l.status, c.sold, NOT c.seen AND l.status = 'ENDED' AS ended
+        ),
+        ended_changes AS (
+            UPDATE listing_price_changes pc
+            SET status = u.status
+            FROM updated u
+            WHERE pc.listing_id = u.id
+            AND pc.status <> u.status
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE sold),
+            COUNT(*) FILTER (WHERE ended)
+        FROM updated;
+    """), {"batch_id": batch_id})
+    sold, ended = result.one()
+    print(f"Marked {sold} listings as sold.")
+    print(f"Marked {ended} listings as ended.")
+
+# create data for price_history table
+def insert_price_history(batch_id):
+    """
+    Append a price_history row only when the current listing price differs
+    from the most recent recorded price (or if no history exists yet),
+    limited to listings present in the current scrape.
+
+    The most recent recorded price is read from listing_price_changes, which
+    is updated in the same statement with the new row as the latest change.
+    """
+    db.session.execute(text(r"""
+        WITH new_history AS (
+            INSERT INTO price_history (listing_id, price, currency)
+            SELECT
+                l.id,
+                l.price,
+                l.currency
+            FROM listings l
+            JOIN temp_summaries ts
+              ON ts.ebay_item_id = l.ebay_item_id
+             AND ts.batch_id = :batch_id
+            LEFT JOIN listing_price_changes c
+              ON c.listing_id = l.id
+            WHERE c.new_price IS NULL
+               OR c.new_price <> l.price
+               OR c.currency <> l.currency
+            RETURNING listing_id, price, currency, recorded_at
+        )
+        INSERT INTO listing_price_changes (
+            listing_id,
+            marketplace,
+            currency,
+            new_price,
+            old_price,
+            drop_amount,
+            discount_percent,
+            changed_at,
+            status
+        )
+        SELECT
+            nh.listing_id,
+            l.marketplace,
+            nh.currency,
+            nh.price,
+            c.new_price,
+            c.new_price - nh.price,
+            (c.new_price - nh.price) / NULLIF(c.new_price, 0) * 100,
+            nh.recorded_at,
+            l.status
+        FROM new_history nh
+        JOIN listings l
+          ON l.id = nh.listing_id
+        LEFT JOIN listing_price_changes c
+          ON c.listing_id = nh.listing_id
+        ON CONFLICT (listing_id)
+        DO UPDATE SET
+            marketplace = EXCLUDED.marketplace,
+            currency = EXCLUDED.currency,
+            new_price = EXCLUDED.new_price,
+            old_price = EXCLUDED.old_price,
+            drop_amount = EXCLUDED.drop_amount,
+            discount_percent = EXCLUDED.discount_percent,
+            changed_at = EXCLUDED.changed_at,
+            status = EXCLUDED.status;
+    """), {"batch_id": batch_id})
+    
+# track prices by model
+def update_model_price_stats(batch_id):
+    """
+    Apply this batch's changes to model_price_stats.
+
+    price_stats_entries holds the price every ACTIVE listing currently adds to
+    its (model_id, marketplace) row. Only listings touched by this run are
+    compared against it: listings in the scrape, listings ended by this run
+    and listings whose title was parsed by this run (ended_at / parsed_at are
+    NOW(), which is constant for the whole pipeline transaction). A run that
+    waited for the pipeline lock may select some of the previous run's
+    listings as well; they already match their entries, so that only costs time.
+    Count and sum get the net delta, min/max are only recomputed from the
+    entries where the old extreme left, and rows left with no listings are removed.
+    """
+    db.session.execute(text(r"""
+        CREATE TEMP TABLE stats_changes ON COMMIT DROP AS
+        WITH candidates AS (
+            SELECT l.id
+            FROM listings l
+            JOIN temp_summaries ts
+              ON ts.ebay_item_id = l.ebay_item_id
+             AND ts.batch_id = :batch_id
+            UNION
+            SELECT id FROM listings WHERE ended_at >= NOW()
+            UNION
+            SELECT id FROM listings WHERE parsed_at >= NOW()
+        ),
+        current AS (
+            SELECT
+                l.id AS listing_id,
+                m.id AS model_id,
+                m.canon_model_id,
+                l.marketplace,
+                l.price
+            FROM candidates c
+            JOIN listings l
+              ON l.id = c.id
+            JOIN models m
+              ON m.listing_id = l.id
+            WHERE l.status = 'ACTIVE'
+            AND l.price IS NOT NULL
+        )
+        SELECT
+            COALESCE(cur.listing_id, e.listing_id) AS listing_id,
+            e.model_id AS old_model_id,
+            e.canon_model_id AS old_canon_model_id,
+            e.marketplace AS old_marketplace,
+            e.price AS old_price,
+            cur.model_id AS new_model_id,
+            cur.canon_model_id AS new_canon_model_id,
+            cur.marketplace AS new_marketplace,
+            cur.price AS new_price
+        FROM current cur
+        FULL JOIN (
+            SELECT e.*
+            FROM price_stats_entries e
+            JOIN candidates c
+              ON c.id = e.listing_id
+        ) e
+          ON e.listing_id = cur.listing_id
+        WHERE (e.model_id, e.canon_model_id, e.marketplace, e.price)
+              IS DISTINCT FROM (cur.model_id, cur.canon_model_id, cur.marketplace, cur.price);
+    """), {"batch_id": batch_id})
+
+    # per-key net change, plus the extremes that were added and removed
+    db.session.execute(text(r"""
+        CREATE TEMP TABLE stats_delta ON COMMIT DROP AS
+        SELECT
+            model_id,
+            marketplace,
+            SUM(count_delta) AS count_delta,
+            SUM(sum_delta) AS sum_delta,
+            MIN(price) FILTER (WHERE count_delta > 0) AS added_min,
+            MAX(price) FILTER (WHERE count_delta > 0) AS added_max,
+            MIN(price) FILTER (WHERE count_delta < 0) AS removed_min,
+            MAX(price) FILTER (WHERE count_delta < 0) AS removed_max
+        FROM (
+            SELECT old_model_id AS model_id, old_marketplace AS marketplace,
+                   old_price AS price, -1 AS count_delta, -old_price AS sum_delta
+            FROM stats_changes
+            WHERE old_model_id IS NOT NULL
+            UNION ALL
+            SELECT new_model_id, new_marketplace,
+                   new_price, 1, new_price
+            FROM stats_changes
+            WHERE new_model_id IS NOT NULL
+        ) d
+        GROUP BY model_id, marketplace;
     """))
 
-# update the price if it has changed
-def update_listing_prices():
+    # entries first, so the min/max recompute below sees the new prices
     db.session.execute(text(r"""
-        UPDATE listings l
-        SET
-            price = ts.price,
-            last_updated = NOW()
-        FROM temp_summaries ts
-        WHERE l.ebay_item_id = ts.ebay_item_id
-        AND l.status = 'ACTIVE'
-        AND l.price <> ts.price;
+        DELETE FROM price_stats_entries e
+        USING stats_changes c
+        WHERE e.listing_id = c.listing_id
+        AND c.new_model_id IS NULL;
     """))
 
-def mark_sold_listings():
-    """
-    Mark listings as ENDED if temp_summaries.sold_at is not NULL.
-    """
-    result = db.session.execute(text(r"""
-        UPDATE listings l
-        SET
-            status = 'ENDED',
-            ended_at = ts.sold_at,
-            last_updated = NOW()
-        FROM temp_summaries ts
-        WHERE l.ebay_item_id = ts.ebay_item_id
-        AND ts.sold_at IS NOT NULL
-        AND l.status != 'ENDED';
+    db.session.execute(text(r"""
+        INSERT INTO price_stats_entries (listing_id, model_id, canon_model_id, marketplace, price)
+        SELECT listing_id, new_model_id, new_canon_model_id, new_marketplace, new_price
+        FROM stats_changes
+        WHERE new_model_id IS NOT NULL
+        ON CONFLICT (listing_id)
+        DO UPDATE SET
+            model_id = EXCLUDED.model_id,
+            canon_model_id = EXCLUDED.canon_model_id,
+            marketplace = EXCLUDED.marketplace,
+            price = EXCLUDED.price;
     """))
-    print(f"Marked {result.rowcount} listings as sold.")
 
-# update last_seen, miss_count, last_updated 
-# each time a listing appears from api
-def update_seen_listings():
+    # existing rows: NULL marks an extreme that left and has to be recomputed
     db.session.execute(text(r"""
-        UPDATE listings l
+        UPDATE model_price_stats s
         SET
-            last_seen = NOW(),
-            miss_count = 0,
-            last_updated = NOW()
-        FROM temp_summaries ts
-        WHERE l.ebay_item_id = ts.ebay_item_id
-        AND l.status = 'ACTIVE';
+            listing_count = s.listing_count + d.count_delta,
+            price_sum = s.price_sum + d.sum_delta,
+            avg_price = (s.price_sum + d.sum_delta) / NULLIF(s.listing_count + d.count_delta, 0),
+            min_price = CASE
+                WHEN d.removed_min <= s.min_price THEN NULL
+                ELSE LEAST(s.min_price, d.added_min)
+            END,
+            max_price = CASE
+                WHEN d.removed_max >= s.max_price THEN NULL
+                ELSE GREATEST(s.max_price, d.added_max)
+            END,
+            updated_at = NOW()
+        FROM stats_delta d
+        WHERE s.model_id = d.model_id
+        AND s.marketplace = d.marketplace;
     """))
 
-# increment the miss_count so listings can be marked as ended.
-def increment_miss_count():
     db.session.execute(text(r"""
-        UPDATE listings l
-        SET
-            miss_count = miss_count + 1,
-            last_updated = NOW()
-        WHERE status = 'ACTIVE'
+        INSERT INTO model_price_stats (
+            model_id,
+            marketplace,
+            avg_price,
+            min_price,
+            max_price,
+            listing_count,
+            price_sum,
+            updated_at
+        )
+        SELECT
+            d.model_id,
+            d.marketplace,
+            d.sum_delta / d.count_delta,
+            d.added_min,
+            d.added_max,
+            d.count_delta,
+            d.sum_delta,
+            NOW()
+        FROM stats_delta d
+        WHERE d.count_delta > 0
         AND NOT EXISTS (
             SELECT 1
-            FROM temp_summaries ts
-            WHERE ts.ebay_item_id = l.ebay_item_id
+            FROM model_price_stats s
+            WHERE s.model_id = d.model_id
+            AND s.marketplace = d.marketplace
         );
     """))
 
-# change status to ended for listings
-def mark_ended_listings():
     result = db.session.execute(text(r"""
-        UPDATE listings
+        DELETE FROM model_price_stats s
+        USING stats_delta d
+        WHERE s.model_id = d.model_id
+        AND s.marketplace = d.marketplace
+        AND s.listing_count <= 0;
+    """))
+    removed = result.rowcount
+
+    db.session.execute(text(r"""
+        UPDATE model_price_stats s
         SET
-            status = 'ENDED',
-            ended_at = NOW(),
-            last_updated = NOW()
-        WHERE status = 'ACTIVE'
-        AND miss_count >= 3;
+            min_price = e.min_price,
+            max_price = e.max_price
+        FROM (
+            SELECT
+                e.model_id,
+                e.marketplace,
+                MIN(e.price) AS min_price,
+                MAX(e.price) AS max_price
+            FROM price_stats_entries e
+            JOIN stats_delta d
+              ON d.model_id = e.model_id
+             AND d.marketplace = e.marketplace
+            GROUP BY e.model_id, e.marketplace
+        ) e
+        WHERE s.model_id = e.model_id
+        AND s.marketplace = e.marketplace
+        AND (s.min_price IS NULL OR s.max_price IS NULL);
     """))
-    print(f"Marked {result.rowcount} listings as ended.")
 
-# create data for price_history table
-def insert_price_history():
+    changed = db.session.execute(text("SELECT COUNT(*) FROM stats_delta;")).scalar()
+    print(f"Updated price stats for {changed} models ({removed} removed).")
+
+    refresh_canonical_price_stats()
+
+    db.session.execute(text("DROP TABLE stats_changes, stats_delta;"))
+
+def refresh_canonical_price_stats(full=False):
     """
-    Append a price_history row only when the current listing price differs
-    from the most recent recorded price (or if no history exists yet),
-    limited to listings present in the current scrape.
+    Recompute canonical_price_stats from price_stats_entries.
+
+    By default only the (canon_model_id, marketplace) keys that the current
+    stats_changes table touched are recomputed, so this has to run inside
+    update_model_price_stats. full=True recomputes every key.
+    Keys are recomputed rather than patched because the median can't be
+    maintained from deltas.
+    """
+    if full:
+        db.session.execute(text(r"""
+            CREATE TEMP TABLE canonical_keys ON COMMIT DROP AS
+            SELECT DISTINCT canon_model_id, marketplace
+            FROM price_stats_entries
+            WHERE canon_model_id IS NOT NULL
+            UNION
+            SELECT canon_model_id, marketplace
+            FROM canonical_price_stats;
+        """))
+    else:
+        db.session.execute(text(r"""
+            CREATE TEMP TABLE canonical_keys ON COMMIT DROP AS
+            SELECT old_canon_model_id AS canon_model_id, old_marketplace AS marketplace
+            FROM stats_changes
+            WHERE old_canon_model_id IS NOT NULL
+            UNION
+            SELECT new_canon_model_id, new_marketplace
+            FROM stats_changes
+            WHERE new_canon_model_id IS NOT NULL;
+        """))
+
+    db.session.execute(text(r"""
+        INSERT INTO canonical_price_stats (
+            canon_model_id,
+            marketplace,
+            listing_count,
+            min_price,
+            avg_price,
+            max_price,
+            median_price,
+            newest_listing,
+            last_seen,
+            cheapest_item,
+            updated_at
+        )
+        SELECT
+            e.canon_model_id,
+            e.marketplace,
+            COUNT(*),
+            MIN(e.price),
+            AVG(e.price),
+            MAX(e.price),
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY e.price),
+            MAX(l.first_seen),
+            MAX(l.last_seen),
+            (ARRAY_AGG(l.ebay_item_id ORDER BY e.price ASC, l.first_seen DESC, l.id DESC))[1],
+            NOW()
+        FROM canonical_keys k
+        JOIN price_stats_entries e
+          ON e.canon_model_id = k.canon_model_id
+         AND e.marketplace = k.marketplace
+        JOIN listings l
+          ON l.id = e.listing_id
+        GROUP BY e.canon_model_id, e.marketplace
+        ON CONFLICT (canon_model_id, marketplace)
+        DO UPDATE SET
+            listing_count = EXCLUDED.listing_count,
+            min_price = EXCLUDED.min_price,
+            avg_price = EXCLUDED.avg_price,
+            max_price = EXCLUDED.max_price,
+            median_price = EXCLUDED.median_price,
+            newest_listing = EXCLUDED.newest_listing,
+            last_seen = EXCLUDED.last_seen,
+            cheapest_item = EXCLUDED.cheapest_item,
+            updated_at = NOW();
+    """))
+
+    # keys whose last listing left
+    db.session.execute(text(r"""
+        DELETE FROM canonical_price_stats c
+        USING canonical_keys k
+        WHERE c.canon_model_id = k.canon_model_id
+        AND c.marketplace = k.marketplace
+        AND NOT EXISTS (
+            SELECT 1
+            FROM price_stats_entries e
+            WHERE e.canon_model_id = k.canon_model_id
+            AND e.marketplace = k.marketplace
+        );
+    """))
+
+    db.session.execute(text("DROP TABLE canonical_keys;"))
+
+def update_canonical_last_seen(batch_id):
+    """
+    Move canonical_price_stats.last_seen to NOW() for the keys with a listing
+    in this batch. Seen listings only change last_seen, so their keys are not
+    in stats_changes and refresh_canonical_price_stats leaves them alone.
     """
     db.session.execute(text(r"""
-        INSERT INTO price_history (listing_id, price, currency)
+        UPDATE canonical_price_stats c
+        SET last_seen = NOW()
+        FROM (
+            SELECT DISTINCT e.canon_model_id, e.marketplace
+            FROM temp_summaries ts
+            JOIN listings l
+              ON l.ebay_item_id = ts.ebay_item_id
+            JOIN price_stats_entries e
+              ON e.listing_id = l.id
+            WHERE ts.batch_id = :batch_id
+            AND e.canon_model_id IS NOT NULL
+        ) k
+        WHERE c.canon_model_id = k.canon_model_id
+        AND c.marketplace = k.marketplace
+        AND c.last_seen IS DISTINCT FROM NOW();
+    """), {"batch_id": batch_id})
+
+def rebuild_model_price_stats():
+    """
+    Recompute price_stats_entries, model_price_stats and canonical_price_stats from scratch.
+    For the first run, after backfills or if the two ever drift apart.
+    """
+    db.session.execute(text(r"""
+        TRUNCATE price_stats_entries;
+    """))
+
+    db.session.execute(text(r"""
+        INSERT INTO price_stats_entries (listing_id, model_id, canon_model_id, marketplace, price)
         SELECT
             l.id,
-            l.price,
-            l.currency
+            m.id,
+            m.canon_model_id,
+            l.marketplace,
+            l.price
         FROM listings l
-        JOIN temp_summaries ts
-          ON ts.ebay_item_id = l.ebay_item_id
-        LEFT JOIN LATERAL (
-            SELECT ph.price, ph.currency
-            FROM price_history ph
-            WHERE ph.listing_id = l.id
-            ORDER BY ph.recorded_at DESC, ph.id DESC
-            LIMIT 1
-        ) last_ph ON TRUE
-        WHERE last_ph.price IS NULL
-           OR last_ph.price <> l.price
-           OR last_ph.currency <> l.currency;
+        JOIN models m
+          ON m.listing_id = l.id
+        WHERE l.status = 'ACTIVE'
+        AND l.price IS NOT NULL;
     """))
-    
-# track prices by model
-def update_model_price_stats():
-    """
-    Update aggregated model pricing stats using the new Model → Listing relationship.
-    """
+
+    db.session.execute(text(r"""
+        DELETE FROM model_price_stats;
+    """))
+
     db.session.execute(text(r"""
         INSERT INTO model_price_stats (
             model_id,
@@ -230,55 +640,92 @@ def update_model_price_stats():
             min_price,
             max_price,
             listing_count,
+            price_sum,
             updated_at
         )
         SELECT
-            m.id AS model_id,
-            l.marketplace,
-            AVG(l.price),
-            MIN(l.price),
-            MAX(l.price),
+            model_id,
+            marketplace,
+            AVG(price),
+            MIN(price),
+            MAX(price),
             COUNT(*),
+            SUM(price),
             NOW()
-        FROM listings l
-        JOIN models m
-          ON m.listing_id = l.id
-        WHERE l.status = 'ACTIVE'
-        GROUP BY m.id, l.marketplace
-        ON CONFLICT (model_id, marketplace)
-        DO UPDATE SET
-            avg_price = EXCLUDED.avg_price,
-            min_price = EXCLUDED.min_price,
-            max_price = EXCLUDED.max_price,
-            listing_count = EXCLUDED.listing_count,
-            updated_at = NOW();
+        FROM price_stats_entries
+        GROUP BY model_id, marketplace;
     """))
 
-# delete temp data
-def truncate_temp_tables():
+    refresh_canonical_price_stats(full=True)
+
+# refresh the /<country>/deals rollup
+def refresh_deals_rollup():
     """
-    Clear temp tables for next scrape.
+    Refresh the deals_rollup materialized view.
+    CONCURRENTLY keeps the deals page readable while it runs; that needs the
+    view to be populated already, which the migration that creates it does.
     """
     db.session.execute(text(r"""
-        TRUNCATE temp_summaries, temp_details;
+        REFRESH MATERIALIZED VIEW CONCURRENTLY deals_rollup;
     """))
 
+# new data is visible to the site, drop every cached page
+def bump_data_version():
+    """
+    Increment data_version, which is part of every page cache key (app/page_cache.py).
+    Run in the transaction that makes the new data visible.
+    """
+    db.session.execute(text(r"""
+        INSERT INTO data_version (id, version, updated_at)
+        VALUES (1, 1, NOW())
+        ON CONFLICT (id)
+        DO UPDATE SET
+            version = data_version.version + 1,
+            updated_at = NOW();
+    """))
+
+# pipeline runs for different batches must not interleave their listing updates
+PIPELINE_LOCK_KEY = 4_177_001
 
-def run_pipeline():
+
+def run_pipeline(batch_id):
     """
-    Full ingestion pipeline.
+    Full ingestion pipeline for one LOADED batch.
+
+    Fetch workers load batches concurrently; runs of the pipeline itself are
+    serialized with a transaction-level advisory lock, taken as the first
+    statement of the transaction. NOW() is fixed when the transaction starts,
+    before the lock is granted, so a run that waited has a NOW() earlier than
+    the commit of the run before it. update_model_price_stats copes with that:
+    its ended_at / parsed_at >= NOW() candidates then also take in listings of
+    the previous run, which compare equal to their entries and change nothing.
     """
-    insert_listings()
+    db.session.commit()
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:key);"), {"key": PIPELINE_LOCK_KEY})
+
+    status = db.session.execute(text(r"""
+        SELECT status FROM fetch_batches WHERE id = :batch_id;
+    """), {"batch_id": batch_id}).scalar()
+    if status != "LOADED":
+        db.session.rollback()
+        print(f"Batch {batch_id} is {status or 'missing'}, not LOADED. Skipping pipeline.")
+        return False
+
+    ensure_price_history_partitions()
+    insert_listings(batch_id)
     process_title() # get model and specs from titles
-    update_listing_prices()
-    mark_sold_listings()
-    update_seen_listings()
-    increment_miss_count()
-    mark_ended_listings()
-    insert_price_history()
-    update_model_price_stats()
-    #insert_specs()
+    update_listing_lifecycle(batch_id) # prices, sold, seen, miss count, ended
+    insert_price_history(batch_id)
+    update_model_price_stats(batch_id)
+    update_canonical_last_seen(batch_id)
+    #insert_specs(batch_id)
     #insert_storage_type() # gets storage_type from raw_storage_type    
+    mark_batch_processed(batch_id)
 
     db.session.commit()
 
+    # last, in its own transaction, once the stats above are committed
+    refresh_deals_rollup()
+    bump_data_version()
+    db.session.commit()
+    return True
@@ -0,0 +1,160 @@
+# PRICE HISTORY PARTITIONS, RETENTION AND DOWNSAMPLING
+# price_history is range partitioned by month on recorded_at (UTC).
+# run retention with: python -m app.services.price_history [--keep-months N]
+
+import argparse
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from app import create_app, db
+
+# months of raw points to keep, older months are rolled into price_history_daily
+RAW_RETENTION_MONTHS = 12
+
+PARTITION_RE = re.compile(r"^price_history_(\d{4})_(\d{2})$")
+
+
+def month_start(day, offset=0):
+    """First day of the month `offset` months after day's month."""
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(start):
+    return f"price_history_{start.year:04d}_{start.month:02d}"
+
+
+def create_price_history_partition(start):
+    """Create the partition for the month starting at start, if missing."""
+    end = month_start(start, 1)
+
+    db.session.execute(text(rf"""
+        CREATE TABLE IF NOT EXISTS {partition_name(start)}
+        PARTITION OF price_history
+        FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00');
+    """))
+
+
+def ensure_price_history_partitions(months_ahead=1):
+    """
+    Make sure this month's and the next months_ahead partitions exist,
+    so inserts never hit a missing range.
+    """
+    today = datetime.now(timezone.utc).date()
+
+    for offset in range(months_ahead + 1):
+        create_price_history_partition(month_start(today, offset))
+
+
+def price_history_partitions():
+    """[(month start, partition name), ...] of the attached partitions, oldest first."""
+    rows = db.session.execute(text(r"""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c
+          ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'price_history'::regclass;
+    """)).scalars()
+
+    partitions = []
+    for name in rows:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((date(int(match[1]), int(match[2]), 1), name))
+
+    return sorted(partitions)
+
+
+def downsample_partition(name):
+    """
+    Roll one partition into price_history_daily: min, max and last price per
+    listing and UTC day. Re-running for a day that already has a row merges
+    into it.
+    """
+    result = db.session.execute(text(rf"""
+        INSERT INTO price_history_daily (
+            listing_id,
+            day,
+            currency,
+            min_price,
+            max_price,
+            last_price,
+            last_recorded_at,
+            points
+        )
+        SELECT
+            listing_id,
+            (recorded_at AT TIME ZONE 'UTC')::date,
+            (ARRAY_AGG(currency ORDER BY recorded_at DESC, id DESC))[1],
+            MIN(price),
+            MAX(price),
+            (ARRAY_AGG(price ORDER BY recorded_at DESC, id DESC))[1],
+            MAX(recorded_at),
+            COUNT(*)
+        FROM {name}
+        WHERE listing_id IS NOT NULL
+        GROUP BY listing_id, (recorded_at AT TIME ZONE 'UTC')::date
+        ON CONFLICT (listing_id, day)
+        DO UPDATE SET
+            min_price = LEAST(price_history_daily.min_price, EXCLUDED.min_price),
+            max_price = GREATEST(price_history_daily.max_price, EXCLUDED.max_price),
+            last_price = CASE
+                WHEN EXCLUDED.last_recorded_at >= price_history_daily.last_recorded_at
+                THEN EXCLUDED.last_price
+                ELSE price_history_daily.last_price
+            END,
+            currency = CASE
+                WHEN EXCLUDED.last_recorded_at >= price_history_daily.last_recorded_at
+                THEN EXCLUDED.currency
+                ELSE price_history_daily.currency
+            END,
+            last_recorded_at = GREATEST(price_history_daily.last_recorded_at, EXCLUDED.last_recorded_at),
+            points = price_history_daily.points + EXCLUDED.points;
+    """))
+    return result.rowcount
+
+
+def apply_price_history_retention(keep_months=RAW_RETENTION_MONTHS):
+    """
+    Downsample and drop every partition that ended more than keep_months ago.
+
+    Each partition is rolled up, detached and dropped in one transaction, so
+    a failed run never counts a month twice. Dropping whole partitions leaves
+    no dead rows behind for vacuum.
+    """
+    cutoff = month_start(datetime.now(timezone.utc).date(), -keep_months)
+    dropped = 0
+
+    for start, name in price_history_partitions():
+        if month_start(start, 1) > cutoff:
+            break
+
+        days = downsample_partition(name)
+
+        db.session.execute(text(f"ALTER TABLE price_history DETACH PARTITION {name};"))
+        db.session.execute(text(f"DROP TABLE {name};"))
+        db.session.commit()
+
+        dropped += 1
+        print(f"Downsampled {name} into {days} daily rows and dropped it.")
+
+    print(f"Price history retention done: {dropped} partitions dropped.")
+    return dropped
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Downsample and drop old price_history partitions.")
+    arg_parser.add_argument("--keep-months", type=int, default=RAW_RETENTION_MONTHS, help="months of raw points to keep")
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        ensure_price_history_partitions()
+        db.session.commit()
+        apply_price_history_retention(keep_months=args.keep_months)
+
+
+if __name__ == "__main__":
+    main()
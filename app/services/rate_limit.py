@@ -0,0 +1,263 @@
+# ADAPTIVE RATE LIMITING AND RETRIES FOR EBAY BROWSE API CALLS
+
+import asyncio
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+RATE_PER_SECOND = 10.0   # starting request rate
+MAX_RATE_PER_SECOND = 25.0
+MIN_RATE_PER_SECOND = 0.5
+BURST = 20
+
+CONCURRENCY = 8          # starting number of requests in flight
+MAX_CONCURRENCY = 16
+MIN_CONCURRENCY = 1
+
+MAX_RETRIES = 5
+MAX_BACKOFF = 60
+MAX_RETRY_AFTER = 120    # longest pause a Retry-After header can impose
+
+
+def parse_retry_after(value):
+    """
+    Return the Retry-After header in seconds (delta or HTTP date), or None.
+    Clamped to MAX_RETRY_AFTER, since it pauses every caller of the controller.
+    """
+    if not value:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+
+    if seconds is not None:
+        if seconds != seconds:  # NaN
+            return None
+        return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+
+    seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class RateController:
+    """
+    Token bucket for the request rate plus an AIMD window for concurrency.
+
+    Successes grow the rate and the window additively. Each 429 halves both,
+    at most once per cooldown so a burst of throttled in-flight requests only
+    counts once. A Retry-After header pauses every caller until it passes.
+
+    One controller (rate_controller) is shared by every request path, also
+    when they run on different event loops: the state is guarded by a thread
+    lock, and callers waiting for a slot wait on their own loop's condition.
+    """
+
+    def __init__(
+        self,
+        rate=RATE_PER_SECOND,
+        burst=BURST,
+        concurrency=CONCURRENCY,
+        min_rate=MIN_RATE_PER_SECOND,
+        max_rate=MAX_RATE_PER_SECOND,
+        min_concurrency=MIN_CONCURRENCY,
+        max_concurrency=MAX_CONCURRENCY,
+        max_retries=MAX_RETRIES,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+        self.counters = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._successes = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._conditions = weakref.WeakKeyDictionary()  # event loop -> asyncio.Condition
+
+    # -----------------------------
+    # Admission
+    # -----------------------------
+    def _take_token(self):
+        """Take a rate token; returns 0, or the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.counters["requests"] += 1
+                return 0
+
+            return (1 - self._tokens) / self.rate
+
+    async def _wait_for_token(self):
+        while wait := self._take_token():
+            await asyncio.sleep(wait)
+
+    def _take_slot(self):
+        with self._lock:
+            if self._in_flight < self.concurrency:
+                self._in_flight += 1
+                return True
+            return False
+
+    def _condition(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._conditions:
+                self._conditions[loop] = asyncio.Condition()
+            return self._conditions[loop]
+
+    async def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+            waiting = list(self._conditions.items())
+
+        current = asyncio.get_running_loop()
+        for loop, condition in waiting:
+            if loop is current:
+                await notify_all(condition)
+            elif not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(notify_all(condition), loop)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot and one rate token for a single request."""
+        condition = self._condition()
+        async with condition:
+            await condition.wait_for(self._take_slot)
+
+        try:
+            await self._wait_for_token()
+            yield
+        finally:
+            await self._release_slot()
+
+    # -----------------------------
+    # Feedback
+    # -----------------------------
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+
+            # additive increase, roughly once per window of successful requests
+            if self._successes >= self.concurrency:
+                self._successes = 0
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.rate = min(self.max_rate, self.rate + 1)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.counters["throttled"] += 1
+            now = time.monotonic()
+
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            # multiplicative decrease, once per cooldown
+            cooldown = max(1.0, 1 / self.rate)
+            if now - self._last_decrease >= cooldown:
+                self._last_decrease = now
+                self._successes = 0
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, 1.0)
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def backoff(self, attempt):
+        return min(MAX_BACKOFF, 2 ** attempt + random.random())
+
+    def stats(self):
+        return {**self.counters, "rate": round(self.rate, 2), "concurrency": self.concurrency}
+
+
+async def notify_all(condition):
+    async with condition:
+        condition.notify_all()
+
+
+# shared by the summary and item-detail paths, so throttling learned on one limits both
+rate_controller = RateController()
+
+
+def is_retryable(status):
+    return status == 429 or 500 <= status < 600
+
+
+async def request_with_retry(client, controller, method, url, label="", **kwargs):
+    """
+    Send a request through the controller, retrying 429/5xx and transport errors.
+    Raises httpx.HTTPError once retries run out or on a non-retryable status.
+    """
+    for attempt in range(controller.max_retries + 1):
+        last_attempt = attempt == controller.max_retries
+
+        try:
+            async with controller.slot():
+                r = await client.request(method, url, **kwargs)
+
+        except httpx.TransportError as e:
+            if last_attempt:
+                controller.count("failed")
+                raise
+
+            wait = controller.backoff(attempt)
+            controller.count("retries")
+            print(f"{label} retry {attempt} in {wait:.1f}s ({e.__class__.__name__})")
+            await asyncio.sleep(wait)
+            continue
+
+        if not is_retryable(r.status_code):
+            if r.is_success:
+                controller.on_success()
+            else:
+                controller.count("failed")
+            r.raise_for_status()
+            return r
+
+        retry_after = parse_retry_after(r.headers.get("Retry-After"))
+
+        if r.status_code == 429:
+            controller.on_throttle(retry_after)
+
+        if last_attempt:
+            controller.count("failed")
+            r.raise_for_status()
+
+        wait = retry_after if retry_after is not None else controller.backoff(attempt)
+        controller.count("retries")
+        print(f"{label} retry {attempt} in {wait:.1f}s ({r.status_code})")
+        await asyncio.sleep(wait)
@@ -1,8 +1,10 @@
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
 from app import db
-from app.models import TempSummaries, TempDetails
+from app.models import TempDetails
 from app.services.field_map import FIELD_MAP
+from sqlalchemy import text
+import io
 import re
 
 
@@ -13,62 +15,155 @@ def clean_text(text: str) -> str: # I might move this into pipeline instead.
     text = re.sub(r'[\U00010000-\U0010ffff]', '', text)
     return text.strip()
 
-def save_temp_summaries(items):
-    
-    # Load all rows once
-    ids = [item["itemId"] for item in items if "itemId" in item]
-
-    existing = {
-        row.ebay_item_id: row
-        for row in TempSummaries.query.filter(
-            TempSummaries.ebay_item_id.in_(ids)
+# items per COPY when loading from a page stream
+SUMMARY_CHUNK_SIZE = 2000
+
+SUMMARY_COLUMNS = (
+    "category_id",
+    "ebay_item_id",
+    "title",
+    "price",
+    "currency",
+    "condition",
+    "listing_type",
+    "marketplace",
+    "item_country",
+    "item_url",
+    "affiliate_url",
+    "creation_date",
+)
+
+
+def summary_row(item):
+    """Turn one API item dict into a temp_summaries row tuple (SUMMARY_COLUMNS order)."""
+    item_id = item.get("itemId")
+    if not item_id:
+        return None
+
+    price_info = item.get("price", {})
+    price_value = price_info.get("value")
+    location = item.get("itemLocation", {})
+
+    creation_date = None
+    if item.get("itemCreationDate"):
+        creation_date = datetime.fromisoformat(
+            item["itemCreationDate"].replace("Z", "+00:00")
         )
-    }
 
-    inserted = 0
+    return (
+        item.get("leafCategoryIds", [None])[0],
+        item_id,
+        clean_text(item.get("title", "")),
+        Decimal(str(price_value)) if price_value else None,
+        price_info.get("currency"),
+        item.get("condition"),
+        ",".join(item.get("buyingOptions", [])),
+        item.get("marketplace_id"),
+        location.get("country"),
+        item.get("itemWebUrl"),
+        item.get("itemAffiliateWebUrl"),
+        creation_date,
+    )
+
+
+def copy_value(value):
+    """Format one value for COPY text format (\\N is NULL)."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Stream rows into a table with COPY ... FROM STDIN."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(map(copy_value, row)))
+        buf.write("\n")
+    buf.seek(0)
+
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+def save_temp_summaries(items, batch_id):
+    """
+    Bulk load summaries into temp_summaries under batch_id.
+    Rows are COPY'd into a session temp table and moved across with one
+    INSERT ... ON CONFLICT DO NOTHING, so the load costs a few round-trips
+    instead of one per item.
+    """
+    rows = [row for row in map(summary_row, items) if row]
+
+    if not rows:
+        print("Inserted 0 into temp db.")
+        return 0
+
+    columns = ", ".join(SUMMARY_COLUMNS)
+
+    db.session.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS temp_summaries_load (
+            category_id VARCHAR(20),
+            ebay_item_id VARCHAR NOT NULL,
+            title TEXT,
+            price NUMERIC(10, 2),
+            currency VARCHAR(10),
+            condition VARCHAR,
+            listing_type VARCHAR(50),
+            marketplace VARCHAR,
+            item_country VARCHAR(2),
+            item_url TEXT,
+            affiliate_url TEXT,
+            creation_date TIMESTAMPTZ
+        ) ON COMMIT DELETE ROWS
+    """))
+
+    cursor = db.session.connection().connection.cursor()
+    try:
+        copy_rows(cursor, "temp_summaries_load", SUMMARY_COLUMNS, rows)
+    finally:
+        cursor.close()
+
+    # duplicates within the load and rows already in the batch are skipped
+    result = db.session.execute(text(f"""
+        INSERT INTO temp_summaries (batch_id, {columns}, first_seen, last_seen, last_updated)
+        SELECT DISTINCT ON (ebay_item_id) :batch_id, {columns}, NOW(), NOW(), NOW()
+        FROM temp_summaries_load
+        ORDER BY ebay_item_id
+        ON CONFLICT (batch_id, ebay_item_id) DO NOTHING
+    """), {"batch_id": batch_id})
+    inserted = result.rowcount
+
+    db.session.execute(text("TRUNCATE temp_summaries_load"))
+    db.session.commit()
+    print(f"Inserted {inserted} into temp db.")
 
-    for item in items:
-        item_id = item.get("itemId")
-        if not item_id:
-            continue
+    return inserted
 
-        price_info = item.get("price", {})
-        price_value = price_info.get("value")
-        category_id = item.get("leafCategoryIds", [None])[0]
-        creation_date = None
-        location = item.get("itemLocation", {})
-        if item.get("itemCreationDate"):
-            creation_date = datetime.fromisoformat(
-                item["itemCreationDate"].replace("Z", "+00:00")
-            )
+def save_temp_summaries_stream(pages, batch_id, chunk_size=SUMMARY_CHUNK_SIZE):
+    """
+    Load an iterable of item pages into batch_id in chunks of at most
+    chunk_size items, so only one chunk is held in memory at a time.
+    """
+    chunk = []
+    inserted = 0
 
-        listing = existing.get(item_id)
+    for page in pages:
+        chunk.extend(page)
 
-        if listing:
-            continue  # skip creating a new listing
-
-        # Create temporary listing with category
-        listing = TempSummaries(
-            category_id=category_id,
-            ebay_item_id=item_id,
-            title = clean_text(item.get("title", "")),
-            price=Decimal(str(price_value)) if price_value else None,
-            currency= price_info.get("currency"),
-            condition=item.get("condition"),
-            listing_type=",".join(item.get("buyingOptions", [])),
-            marketplace=item.get("marketplace_id"),            
-            item_country = location.get("country"),
-            item_url=item.get("itemWebUrl"),
-            affiliate_url=item.get("itemAffiliateWebUrl"),
-            creation_date = creation_date            
-        )
-        db.session.add(listing)
-        db.session.flush()       
+        if len(chunk) >= chunk_size:
+            inserted += save_temp_summaries(chunk, batch_id)
+            chunk = []
 
-        inserted += 1
+    if chunk:
+        inserted += save_temp_summaries(chunk, batch_id)
+
+    return inserted
 
-    db.session.commit()
-    print(f"Inserted {inserted} into temp db.")
 
 def save_seller_info(listing, item):
     # -------------------------
@@ -92,12 +187,13 @@ def save_seller_info(listing, item):
 # Main function
 # -------------------------
 
-def save_temp_details(items):
+def save_temp_details(items, batch_id):
 
     ids = [item["itemId"] for item in items if "itemId" in item]
     existing = {
         row.ebay_item_id: row
         for row in TempDetails.query.filter(
+            TempDetails.batch_id == batch_id,
             TempDetails.ebay_item_id.in_(ids)
         )
     }
@@ -110,7 +206,7 @@ def save_temp_details(items):
 
         listing = existing.get(item_id)
         if not listing:
-            listing = TempDetails(ebay_item_id=item_id)
+            listing = TempDetails(batch_id=batch_id, ebay_item_id=item_id)
             db.session.add(listing)
             existing[item_id] = listing
 
@@ -0,0 +1,108 @@
+# REPARSE LISTING TITLES IN PARALLEL FOR LARGE BACKFILLS (e.g. after a PARSE_VERSION bump)
+# run with: python -m app.services.title_backfill [--all] [--workers N] [--chunk-size N]
+
+import argparse
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.services.pipeline import PIPELINE_LOCK_KEY, bump_data_version, rebuild_model_price_stats, refresh_deals_rollup
+from app.services.title_parse import (
+    PARSE_CHUNK_SIZE,
+    PARSE_VERSION,
+    build_title_parser,
+    iter_title_chunks,
+    save_parsed_titles,
+    title_hash,
+)
+
+# set in each worker process by init_worker
+_parser = None
+
+
+def init_worker(parser):
+    global _parser
+    _parser = parser
+
+
+def parse_chunk(rows):
+    """[(listing_id, title), ...] -> [(listing_id, title_hash, ParsedTitle), ...]"""
+    return [
+        (listing_id, title_hash(title), _parser.parse(title))
+        for listing_id, title in rows
+    ]
+
+
+def backfill_titles(full=False, workers=None, chunk_size=PARSE_CHUNK_SIZE):
+    """
+    Parse titles on every core and write the results back in bulk.
+
+    Chunks of (id, title) go to a process pool; results are written with
+    save_parsed_titles and committed per chunk, so nothing goes through the
+    ORM identity map. At most two chunks per worker are in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    parser = build_title_parser()
+
+    # spawn, so workers don't inherit the parent's db connections
+    context = multiprocessing.get_context("spawn")
+
+    parsed = 0
+    pending = deque()
+
+    def write(future):
+        nonlocal parsed
+        rows = future.result()
+        save_parsed_titles(rows)
+        db.session.commit()
+        parsed += len(rows)
+        print(f"Parsed {parsed} titles")
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(parser,),
+    ) as pool:
+        for chunk in iter_title_chunks(chunk_size, full):
+            pending.append(pool.submit(parse_chunk, chunk))
+
+            if len(pending) >= workers * 2:
+                write(pending.popleft())
+
+        while pending:
+            write(pending.popleft())
+
+    # models changed outside the pipeline, so the incremental stats can't see them.
+    # same lock as the pipeline, as the first statement of the rebuild, so a
+    # fetch run never mixes its deltas with the full rebuild
+    db.session.commit()
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:key);"), {"key": PIPELINE_LOCK_KEY})
+    rebuild_model_price_stats()
+    db.session.commit()
+    refresh_deals_rollup()
+    bump_data_version()
+    db.session.commit()
+
+    print(f"Backfill done: {parsed} titles parsed with PARSE_VERSION {PARSE_VERSION}.")
+    return parsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Reparse listing titles in parallel.")
+    arg_parser.add_argument("--all", action="store_true", help="reparse every listing, not just stale ones")
+    arg_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    arg_parser.add_argument("--chunk-size", type=int, default=PARSE_CHUNK_SIZE, help="titles per chunk")
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        backfill_titles(full=args.all, workers=args.workers, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,96 @@
 # TITLE PARSING TO REPLACE DETAILED ITEM FETCH.
 
+import hashlib
 import re
-from app.models import ThinkPadModel, CPU, Model, Listing, Specs
+from collections import namedtuple
+from sqlalchemy import func, or_, select, text
+from app.models import ThinkPadModel, CPU, Listing
+from app.services.model_matcher import ModelMatcher
 from app import db
 
+# bump when the parsing rules change so every listing is parsed again
+PARSE_VERSION = 1
 
+# listings per read / bulk write
+PARSE_CHUNK_SIZE = 2000
+
+
+# -----------------------------
+# Rules (compiled once)
+# Every rule function below expects a title that already went through
+# normalize_title, so a title is only normalized once per parse.
+# -----------------------------
+WHITESPACE_RE = re.compile(r"\s+")
+THINKPAD_RE = re.compile(r"\bthinkpad\b")
+
+# model fallback when no canonical name is found, first match wins
+MODEL_PATTERNS = [
+    #("base_match", re.compile(r"\b[a-z]+\d{1,4}[a-z]?(?:-?\d{1,2})?\b")),
+    ("simple_match", re.compile(r"\b(x|t|p|e|l|w|z|a|sl)(\d{1,4}[a-z]?)\b")),
+    ("number_letter_match", re.compile(r"\b\d{2,3}[a-z](?=\s|$)")),
+    ("edge_match", re.compile(r"\bedge\s*(\d{1,2})\b")),
+    ("odd_match", re.compile(r"\bthinkpad\s*13(?=\s|$)")),
+    ("numbers_match", re.compile(r"\b\d{3}(?=\s|$)")),
+]
+
+# appended to a pattern-matched model name when present in the title
+MODEL_SUFFIXES = [
+    (re.compile(r"\bcarbon\b"), "Carbon"),
+    (re.compile(r"\byoga\b"), "Yoga"),
+    (re.compile(r"\btablet\b"), "Tablet"),
+    (re.compile(r"\b2[\s-]?in[\s-]?1\b"), "2-in-1"),
+]
+
+MEMORY_RE = re.compile(r"\b(\d+)\s?(mb|gb|tb)\b")
+
+STORAGE_TYPE_RE = re.compile(r"\b(hdd|ssd|nvme)\b")
+STORAGE_TYPES = {"hdd": "HDD", "ssd": "SSD", "nvme": "NVMe"}
+
+# tried in order against the upper-cased title
+CPU_NUM_PATTERNS = [
+    re.compile(r"\b(\d{3,5}[A-Z]{1,2}\d?)\b"),
+    re.compile(r"\b([A-Z]\d{3,5}[A-Z]?)\b"),
+]
+
+INTEL_CPU_RE = re.compile(r"\bi[3579][\s\-]?\d{4,5}[a-z]{1,3}\b", re.IGNORECASE)
+AMD_CPU_NUM_RE = re.compile(r"\b\d{4}[a-z]{1,3}\b", re.IGNORECASE)
+RYZEN_RE = re.compile(r"\bryzen\b", re.IGNORECASE)
+RYZEN_FAMILY_RE = re.compile(r"\bryzen[\s\-]?(\d)\b", re.IGNORECASE)
+CPU_FAMILY_RE = re.compile(r"\b(i3|i5|i7|i9|ryzen 3|ryzen 5|ryzen 7|ryzen 9)\b")
+PRO_RE = re.compile(r"\bPRO\b")
+
+
+ParsedTitle = namedtuple(
+    "ParsedTitle",
+    ["model", "canon_model_id", "ram", "storage", "storage_type", "cpu"],
+)
 
 
 def normalize_title(title):
     title = title.lower()
-    title = re.sub(r"\s+", " ", title)
+    title = WHITESPACE_RE.sub(" ", title)
     return title.strip()
 
-# find the model in the first four words after "thinkpad"
-def find_model_near_thinkpad(title, known_models, sorted_models):
-    title = normalize_title(title)
-
+def thinkpad_window(title):
+    """The first four tokens after "thinkpad" in a normalized title, or None."""
     if "thinkpad" not in title:
-        #print("not thinkpad")
-        return None, None
+        return None
 
     after = title.split("thinkpad", 1)[1].strip()
-    window = " ".join(after.split()[:4])  # next 4 tokens
+    return " ".join(after.split()[:4])  # next 4 tokens
+
+# find the model in the first four words after "thinkpad"
+def find_model_near_thinkpad(title, matcher):
+    window = thinkpad_window(title)
+    if window is None:
+        #print("not thinkpad")
+        return None, None
 
-    for model in sorted_models:
-        if re.search(rf"\b{re.escape(model.lower())}\b", window):
-            canon_id = known_models[model]
-            #print(model)
-            return model, canon_id
+    # longest canonical name in the window, one pass over all names
+    model, canon_id = matcher.match(window)
+    if model:
+        #print(model)
+        return model, canon_id
 
     # use pattern match if no canon model in title
     # fallback regex
@@ -44,147 +107,54 @@ def simple_format(name):
 
 # use a regex pattern to find the model in the title
 def find_model_by_pattern(title):
-    title = normalize_title(title)
-
     # discard titles that don't contain "thinkpad"
-    if not re.search(r"\bthinkpad\b", title):
+    if not THINKPAD_RE.search(title):
         #print("not thinkpad")
         return None
 
-    patterns = [
-    #("base_match", r"\b[a-z]+\d{1,4}[a-z]?(?:-?\d{1,2})?\b"),
-    ("simple_match", r"\b(x|t|p|e|l|w|z|a|sl)(\d{1,4}[a-z]?)\b"),   
-    ("number_letter_match", r"\b\d{2,3}[a-z](?=\s|$)"),
-    ("edge_match", r"\bedge\s*(\d{1,2})\b"),
-    ("odd_match", r"\bthinkpad\s*13(?=\s|$)"),
-    ("numbers_match", r"\b\d{3}(?=\s|$)"),
-    ]
-    
-    has_carbon = bool(re.search(r"\bcarbon\b", title))
-    has_yoga = bool(re.search(r"\byoga\b", title))
-    has_tablet = bool(re.search(r"\btablet\b", title))
-    has_2in1 = bool(re.search(r"\b2[\s-]?in[\s-]?1\b", title))   
-        
     # return first match only
-    for name, pattern in patterns:
-        match = re.search(pattern, title)
+    for name, pattern in MODEL_PATTERNS:
+        match = pattern.search(title)
         if match:
             parts = [simple_format(match.group(0))]
-
-            if has_carbon:
-                parts.append("Carbon")
-            if has_yoga:
-                parts.append("Yoga")
-            if has_tablet:
-                parts.append("Tablet")
-            if has_2in1:
-                parts.append("2-in-1")
-            #if has_gen:
-            #    parts.append(f"Gen {has_gen}")
+            parts.extend(suffix for suffix_re, suffix in MODEL_SUFFIXES if suffix_re.search(title))
 
             model_name = " ".join(parts)
 
             #print(name, model_name)
             return model_name
-        
+
     #print("no match")
     return None
-        
-#    # return all matches
-#    matches = []
-#
-#    for name, pattern in patterns:
-#        match - re.searh(pattern, title)
-#        if match:
-#            matches.append((name, match.group(0)))
-#    print(matches)
-#    return matches
-
-
-def insert_model_from_title(session, listing, known_models, sorted_models):
-    model_name, canon_id = find_model_near_thinkpad(listing.title, known_models, sorted_models)
-
-    if not model_name:
-        return
-
-    if listing.model:
-        # update existing row
-        listing.model.name = model_name.strip()
-        listing.model.canon_model_id = canon_id
-    else:
-        # create new row
-        model = Model(
-            name=model_name.strip(),
-            canon_model_id=canon_id,
-            listing=listing,
-        )
-        session.add(model)
-
-
-def process_title():
-    known_models = {m.name: m.id for m in ThinkPadModel.query.all()}
-
-    sorted_models = sorted(known_models, key=len, reverse=True)
-
-    cpu_lookup = build_cpu_lookup()   
-    
-    for listing in Listing.query.yield_per(500):
-        insert_model_from_title(db.session, listing, known_models, sorted_models)
-
-        ram, storage = find_memory(listing.title)
-        storage_type = find_storage_type(listing.title)
-        cpu = cpu_match(listing.title, cpu_lookup)
-
-        upsert_specs(listing, ram, storage, storage_type, cpu)
-
-  
-
-
-def upsert_specs(listing, ram, storage, storage_type, cpu):
-    if not listing.specs:
-        listing.specs = Specs()
-
-    if ram is not None:
-        listing.specs.ram = ram
-
-    if storage is not None:
-        listing.specs.storage = storage
-
-    if storage_type:
-        listing.specs.storage_type = storage_type
-
-    if cpu:
-        listing.specs.cpu = cpu
 
 
+# -----------------------------
 # Parse title for CPU
+# -----------------------------
 
 def build_cpu_lookup():
+    """{cpu_num: cpu name} for every CPU with a cpu_num."""
     cpus = CPU.query.filter(CPU.cpu_num.isnot(None)).all()
-    return {cpu.cpu_num.upper(): cpu for cpu in cpus}
+    return {cpu.cpu_num.upper(): cpu.name for cpu in cpus}
 
 
 def build_cpu_name_list():
     cpus = CPU.query.all()
-    return cpus  
+    return cpus
 
 def find_cpu_pattern(title): # THIS REGEX NEEDS TO BE IMPROVED
-    title = normalize_title(title)
-
     # Intel full match (i7 1185G7 etc)
-    intel_match = re.search(r"\bi[3579][\s\-]?\d{4,5}[a-z]{1,3}\b", title, re.IGNORECASE)
+    intel_match = INTEL_CPU_RE.search(title)
     if intel_match:
         intel = format_cpu_match(intel_match.group(0))
         return intel
 
     # AMD full match (ryzen 5 5600U etc)
-    amd_match = re.search(r"\b\d{4}[a-z]{1,3}\b", title, re.IGNORECASE)
-    ryzen_match = re.search(r"\bryzen\b", title, re.IGNORECASE)
-    if amd_match or ryzen_match:
+    if AMD_CPU_NUM_RE.search(title) or RYZEN_RE.search(title):
         return assemble_amd_name(title)
 
     # Fallback (family only)
-    fallback_match = re.search(r"\b(i3|i5|i7|i9|ryzen 3|ryzen 5|ryzen 7|ryzen 9)\b", title)
+    fallback_match = CPU_FAMILY_RE.search(title)
     if fallback_match:
         fallback = format_cpu_match(fallback_match.group(0))
         return fallback
@@ -194,15 +164,13 @@ def find_cpu_pattern(title): # THIS REGEX NEEDS TO BE IMPROVED
 
 
 def assemble_amd_name(title):
-    title = normalize_title(title)
-
     cpu_name = []
 
-    ryzen_match = re.search(r"\bryzen[\s\-]?(\d)\b", title, re.IGNORECASE)
+    ryzen_match = RYZEN_FAMILY_RE.search(title)
     if ryzen_match:
         cpu_name.append(f"Ryzen {ryzen_match.group(1)}")
 
-    amd_match = re.search(r"\b\d{4}[a-z]{1,3}\b", title)
+    amd_match = AMD_CPU_NUM_RE.search(title)
     if amd_match:
         cpu_name.append(amd_match.group(0).upper())
 
@@ -225,7 +193,7 @@ def format_cpu_match(value):
         result = value
 
     # fix PRO casing everywhere except start logic already handled
-    result = re.sub(r"\bPRO\b", "Pro", result)
+    result = PRO_RE.sub("Pro", result)
 
     return result
 
@@ -235,13 +203,10 @@ def extract_cpu_num(title):
 
     title = title.upper()
 
-    match = re.search(r"\b(\d{3,5}[A-Z]{1,2}\d?)\b", title)
-    if match:
-        return match.group(1)
-
-    match = re.search(r"\b([A-Z]\d{3,5}[A-Z]?)\b", title)
-    if match:
-        return match.group(1)
+    for pattern in CPU_NUM_PATTERNS:
+        match = pattern.search(title)
+        if match:
+            return match.group(1)
 
     return None
 
@@ -256,29 +221,29 @@ def cpu_match(title, cpu_lookup):
     # 1. cpu_num lookup (fast dictionary)
     cpu = resolve_cpu_from_title(title, cpu_lookup)
     if cpu:
-        return cpu.name
+        return cpu
 
     # 2. regex pattern fallback
     pattern = find_cpu_pattern(title)
     if pattern:
-        return pattern    
-    
+        return pattern
+
     return None
 
 
+# -----------------------------
 # Parse title for RAM and Storage values
+# -----------------------------
 
 def find_memory(title):
-    title = normalize_title(title)
-    matches = re.findall(r"\b(\d+)\s?(mb|gb|tb)\b", title)
+    matches = MEMORY_RE.findall(title)
 
     if not matches:
         return None, None
-    
+
     values = []
     for num, unit in matches:
         num = int(num)
-        unit = unit.lower()
         if unit == "tb":
             num *= 1024
         elif unit == "mb":
@@ -295,31 +260,226 @@ def find_memory(title):
             return val, None
         else:
             return None, val
-    
+
     # the smaller value is treated as ram and the larger as storage
     ram = values[0]
     storage = values[-1]
 
     return ram, storage
 
+# -----------------------------
 # Parse title for STORAGE TYPE
+# -----------------------------
 
 def find_storage_type(title):
-    title = normalize_title(title)
-    match = re.search(r"\b(hdd|ssd|nvme)\b", title)
+    match = STORAGE_TYPE_RE.search(title)
 
     if not match:
         return None
 
-    storage_type = match.group(0)
-    
-    if storage_type == "hdd":
-        storage_type = "HDD"
-    elif storage_type == "ssd":
-        storage_type = "SSD"
-    elif storage_type == "nvme":
-        storage_type = "NVMe"
+    return STORAGE_TYPES[match.group(0)]
+
+
+# -----------------------------
+# Title parser
+# -----------------------------
+
+class TitleParser:
+    """
+    Runs every rule over a title and returns one ParsedTitle.
+    Holds only plain data (the compiled matcher and a cpu_num -> name dict),
+    so it can be built once and shipped to worker processes.
+    """
+
+    def __init__(self, known_models, cpu_lookup):
+        """known_models = {canonical name: id}, cpu_lookup = {cpu_num: cpu name}"""
+        self.matcher = ModelMatcher(known_models)
+        self.cpu_lookup = cpu_lookup
+
+    def parse(self, title):
+        title = normalize_title(title or "")
+
+        model_name, canon_id = find_model_near_thinkpad(title, self.matcher)
+        ram, storage = find_memory(title)
+
+        return ParsedTitle(
+            model=model_name.strip() if model_name else None,
+            canon_model_id=canon_id if model_name else None,
+            ram=ram,
+            storage=storage,
+            storage_type=find_storage_type(title),
+            cpu=cpu_match(title, self.cpu_lookup) or None,
+        )
+
+    def parse_many(self, titles):
+        """Parse a batch of titles, results in the same order."""
+        return [self.parse(title) for title in titles]
+
+
+def build_title_parser():
+    """TitleParser loaded with the canonical models and CPUs from the db."""
+    known_models = {m.name: m.id for m in ThinkPadModel.query.all()}
+    return TitleParser(known_models, build_cpu_lookup())
+
+
+# -----------------------------
+# Write parse results
+# -----------------------------
+
+def save_parsed_titles(rows):
+    """
+    Bulk write parse results.
+    rows = [(listing_id, title_hash, ParsedTitle), ...]
+
+    One statement per table: models and specs are upserted from arrays with
+    ON CONFLICT (listing_id), spec values only overwrite when the new value
+    is not None, and the listings get their parse markers. The caller commits.
+    """
+    if not rows:
+        return
+
+    models = [(listing_id, parsed) for listing_id, _, parsed in rows if parsed.model]
+
+    if models:
+        db.session.execute(text(r"""
+            INSERT INTO models (listing_id, name, canon_model_id)
+            SELECT *
+            FROM unnest(
+                CAST(:listing_ids AS integer[]),
+                CAST(:names AS varchar[]),
+                CAST(:canon_ids AS integer[])
+            )
+            ON CONFLICT (listing_id)
+            DO UPDATE SET
+                name = EXCLUDED.name,
+                canon_model_id = EXCLUDED.canon_model_id;
+        """), {
+            "listing_ids": [listing_id for listing_id, _ in models],
+            "names": [parsed.model for _, parsed in models],
+            "canon_ids": [parsed.canon_model_id for _, parsed in models],
+        })
+
+    db.session.execute(text(r"""
+        INSERT INTO specs (
+            listing_id,
+            ram,
+            storage,
+            storage_type,
+            cpu,
+            ram_processed,
+            storage_processed,
+            storage_type_processed
+        )
+        SELECT
+            v.listing_id,
+            v.ram,
+            v.storage,
+            v.storage_type,
+            v.cpu,
+            FALSE,
+            FALSE,
+            FALSE
+        FROM unnest(
+            CAST(:listing_ids AS integer[]),
+            CAST(:rams AS float8[]),
+            CAST(:storages AS float8[]),
+            CAST(:storage_types AS text[]),
+            CAST(:cpus AS text[])
+        ) AS v(listing_id, ram, storage, storage_type, cpu)
+        ON CONFLICT (listing_id)
+        DO UPDATE SET
+            ram = COALESCE(EXCLUDED.ram, specs.ram),
+            storage = COALESCE(EXCLUDED.storage, specs.storage),
+            storage_type = COALESCE(EXCLUDED.storage_type, specs.storage_type),
+            cpu = COALESCE(EXCLUDED.cpu, specs.cpu);
+    """), {
+        "listing_ids": [listing_id for listing_id, _, _ in rows],
+        "rams": [parsed.ram for _, _, parsed in rows],
+        "storages": [parsed.storage for _, _, parsed in rows],
+        # empty strings never overwrote a stored value either
+        "storage_types": [parsed.storage_type or None for _, _, parsed in rows],
+        "cpus": [parsed.cpu or None for _, _, parsed in rows],
+    })
+
+    db.session.execute(text(r"""
+        UPDATE listings l
+        SET
+            title_hash = v.title_hash,
+            parse_version = :parse_version,
+            parsed_at = NOW()
+        FROM unnest(
+            CAST(:listing_ids AS integer[]),
+            CAST(:hashes AS varchar[])
+        ) AS v(id, title_hash)
+        WHERE l.id = v.id;
+    """), {
+        "listing_ids": [listing_id for listing_id, _, _ in rows],
+        "hashes": [row_hash for _, row_hash, _ in rows],
+        "parse_version": PARSE_VERSION,
+    })
+
+
+def title_hash(title):
+    """md5 of the title, same value as md5(COALESCE(title, '')) in postgres."""
+    return hashlib.md5((title or "").encode("utf-8")).hexdigest()
+
+
+def stale_parse_filter():
+    """
+    Listings whose parse is missing or stale:
+    never parsed, title changed since parsing, or parsed by an older PARSE_VERSION.
+    """
+    return or_(
+        Listing.parse_version.is_(None),
+        Listing.title_hash.is_distinct_from(func.md5(func.coalesce(Listing.title, ""))),
+        Listing.parse_version < PARSE_VERSION,
+    )
+
+
+def iter_title_chunks(chunk_size=PARSE_CHUNK_SIZE, full=False):
+    """
+    Stream (id, title) tuples in id order, one chunk per query.
+    Keyset paging keeps each query an index range scan and works both inside
+    one transaction and across commits made between chunks.
+    """
+    last_id = 0
+
+    while True:
+        stmt = (
+            select(Listing.id, Listing.title)
+            .where(Listing.id > last_id)
+            .order_by(Listing.id)
+            .limit(chunk_size)
+        )
+        if not full:
+            stmt = stmt.where(stale_parse_filter())
+
+        rows = [tuple(row) for row in db.session.execute(stmt)]
+        if not rows:
+            return
+
+        last_id = rows[-1][0]
+        yield rows
+
+
+def process_title(full=False, chunk_size=PARSE_CHUNK_SIZE):
+    """
+    Parse model and specs from titles.
+    Only new, changed or outdated listings are parsed unless full=True.
+
+    Titles are read as plain (id, title) rows and the results are written
+    with save_parsed_titles, one set-based upsert per table per chunk.
+    """
+    parser = build_title_parser()
 
-    return storage_type
+    parsed = 0
 
+    for chunk in iter_title_chunks(chunk_size, full):
+        save_parsed_titles([
+            (listing_id, title_hash(title), parser.parse(title))
+            for listing_id, title in chunk
+        ])
+        parsed += len(chunk)
 
+    print(f"Parsed {parsed} listing titles.")
+    return parsed
@@ -0,0 +1,111 @@
+"""partitioned price history
+
+Revision ID: 2f6c8d1e4b97
+Revises: e17b93c4a2d8
+Create Date: 2026-10-18 18:05:31.662049
+
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6c8d1e4b97'
+down_revision = 'e17b93c4a2d8'
+branch_labels = None
+depends_on = None
+
+
+def month_start(day, offset=0):
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # keep the old heap table around until its rows are copied
+    op.drop_index('ix_price_history_recorded_at', table_name='price_history')
+    op.execute("ALTER TABLE price_history RENAME TO price_history_old")
+    op.execute("ALTER TABLE price_history_old RENAME CONSTRAINT price_history_pkey TO price_history_old_pkey")
+
+    op.execute("""
+        CREATE TABLE price_history (
+            id INTEGER NOT NULL DEFAULT nextval('price_history_id_seq'),
+            listing_id INTEGER,
+            price NUMERIC(10, 2),
+            currency VARCHAR(10) NOT NULL,
+            recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, recorded_at),
+            FOREIGN KEY (listing_id) REFERENCES listings (id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (recorded_at)
+    """)
+    op.execute("ALTER SEQUENCE price_history_id_seq OWNED BY price_history.id")
+    op.create_index('idx_price_history_listing_recorded', 'price_history', ['listing_id', sa.text('recorded_at DESC')], unique=False)
+
+    # one partition per month from the oldest row up to next month
+    oldest = bind.execute(sa.text("SELECT MIN(recorded_at) FROM price_history_old")).scalar()
+    today = datetime.now(timezone.utc).date()
+    start = month_start(oldest.astimezone(timezone.utc).date() if oldest else today)
+    last = month_start(today, 1)
+
+    while start <= last:
+        end = month_start(start, 1)
+        op.execute(
+            f"CREATE TABLE price_history_{start.year:04d}_{start.month:02d} "
+            f"PARTITION OF price_history "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+        )
+        start = end
+
+    op.execute("""
+        INSERT INTO price_history (id, listing_id, price, currency, recorded_at)
+        SELECT id, listing_id, price, currency, recorded_at
+        FROM price_history_old
+    """)
+    op.execute("DROP TABLE price_history_old")
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('price_history_daily',
+    sa.Column('listing_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('currency', sa.String(length=10), nullable=False),
+    sa.Column('min_price', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('max_price', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('last_price', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('last_recorded_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('points', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['listing_id'], ['listings.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('listing_id', 'day')
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    op.drop_table('price_history_daily')
+
+    # back to a single heap table, partitions go with the parent
+    op.execute("ALTER TABLE price_history RENAME TO price_history_old")
+    op.execute("ALTER SEQUENCE price_history_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE price_history (
+            id INTEGER NOT NULL DEFAULT nextval('price_history_id_seq'),
+            listing_id INTEGER,
+            price NUMERIC(10, 2),
+            currency VARCHAR(10) NOT NULL,
+            recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute("""
+        INSERT INTO price_history (id, listing_id, price, currency, recorded_at)
+        SELECT id, listing_id, price, currency, recorded_at
+        FROM price_history_old
+    """)
+    op.execute("DROP TABLE price_history_old")
+
+    op.execute("ALTER TABLE price_history ADD CONSTRAINT price_history_pkey PRIMARY KEY (id)")
+    op.execute("ALTER TABLE price_history ADD CONSTRAINT price_history_listing_id_fkey FOREIGN KEY (listing_id) REFERENCES listings (id) ON DELETE CASCADE")
+    op.execute("ALTER SEQUENCE price_history_id_seq OWNED BY price_history.id")
+    op.create_index('ix_price_history_recorded_at', 'price_history', ['recorded_at'], unique=False)
@@ -0,0 +1,63 @@
+"""added deals rollup view
+
+Revision ID: 9a4f6b2e8c51
+Revises: 5e0d4a7c19b3
+Create Date: 2026-10-18 16:48:13.227560
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4f6b2e8c51'
+down_revision = '5e0d4a7c19b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # one row per canonical model and marketplace for the /<country>/deals page,
+    # refreshed by pipeline.refresh_deals_rollup
+    op.execute("""
+        CREATE MATERIALIZED VIEW deals_rollup AS
+        WITH price_drops AS (
+            -- models with a listing below the highest price it was ever recorded at
+            SELECT DISTINCT e.canon_model_id, e.marketplace
+            FROM price_stats_entries e
+            JOIN (
+                SELECT listing_id, MAX(price) AS max_price
+                FROM price_history
+                GROUP BY listing_id
+            ) ph
+              ON ph.listing_id = e.listing_id
+            WHERE e.price < ph.max_price
+        )
+        SELECT
+            c.canon_model_id,
+            c.marketplace,
+            ml.name AS model_name,
+            ml.slug,
+            c.min_price AS cheapest_price,
+            c.cheapest_item,
+            c.listing_count,
+            c.newest_listing,
+            -- some listing is under 75% of the model's average
+            COALESCE(c.min_price < c.avg_price * 0.75, FALSE) AS is_best_deal,
+            pd.canon_model_id IS NOT NULL AS has_price_drop
+        FROM canonical_price_stats c
+        JOIN model_list ml
+          ON ml.id = c.canon_model_id
+        LEFT JOIN price_drops pd
+          ON pd.canon_model_id = c.canon_model_id
+         AND pd.marketplace = c.marketplace
+    """)
+    # unique index is required for REFRESH ... CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX idx_deals_rollup_key ON deals_rollup (canon_model_id, marketplace)")
+    op.execute("CREATE INDEX idx_deals_rollup_price ON deals_rollup (marketplace, cheapest_price)")
+    op.execute("CREATE INDEX idx_deals_rollup_count ON deals_rollup (marketplace, listing_count)")
+    op.execute("CREATE INDEX idx_deals_rollup_name ON deals_rollup (marketplace, lower(model_name))")
+
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS deals_rollup")